@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'memohera_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Live badge counts are streamed outside Django's request handling (see memorials.live)
+from memorials.live import with_inbox_stream  # noqa: E402 - needs the app registry
+
+application = with_inbox_stream(django_application)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 from django.utils.translation import gettext_lazy as _
 
@@ -62,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'memorials.middleware.LazyContextReportMiddleware',  # Reports only when DEBUG
 ]
 
 ROOT_URLCONF = 'memohera_project.urls'
@@ -174,6 +176,21 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'create_memorial'
 LOGOUT_REDIRECT_URL = 'about'
 
+# Log app messages (e.g. browse cache hits/misses) to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'memorials': {
+            'handlers': ['console'],
+            'level': os.environ.get('MEMORIALS_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -273,3 +290,105 @@ else:
     }
 
 
+# Caches
+# A Redis-compatible server when REDIS_URL is set. Otherwise local stand-ins:
+# file-based in production (shared by all worker processes on the host) and
+# per-process memory in development. CACHE_BACKEND=redis|file|locmem overrides.
+#   default   - general data (browse counts and facets)
+#   fragments - rendered HTML fragments (browse results)
+#   counters  - version numbers and small hot values (inbox badge counts)
+#   sessions  - session store in front of the database (cached_db)
+# Every cached value is keyed by a version in 'counters', and the web and
+# worker services run on different hosts, so without Redis 'counters' lives
+# in a database table (CACHE_TABLE, made by `manage.py createcachetable`)
+# rather than in per-host files.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or ('redis' if REDIS_URL else 'locmem' if DEBUG else 'file')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'memohera-cache'))
+CACHE_TABLE = 'memorials_cache'
+
+
+def cache_config(alias, timeout=300):
+    """CACHES entry for `alias` on the selected backend"""
+    if CACHE_BACKEND == 'redis':
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': alias,
+            'TIMEOUT': timeout,
+        }
+    if CACHE_BACKEND == 'file' and alias == 'counters':
+        return {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': CACHE_TABLE,
+            'KEY_PREFIX': alias,
+            'TIMEOUT': timeout,
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    if CACHE_BACKEND == 'file':
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, alias),
+            'TIMEOUT': timeout,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    return {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': alias,
+        'TIMEOUT': timeout,
+    }
+
+
+CACHES = {
+    'default': cache_config('default'),
+    'fragments': cache_config('fragments'),
+    'counters': cache_config('counters', timeout=600),
+    'sessions': cache_config('sessions', timeout=60 * 60 * 24 * 14),
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+BROWSE_COUNT_CACHE_TIMEOUT = 300  # browse counts and facets, 'default' cache
+BROWSE_RESULTS_CACHE_TIMEOUT = 300  # rendered browse result pages, 'fragments' cache
+INBOX_COUNTS_CACHE_TIMEOUT = 600  # navbar badge counts, 'counters' cache
+
+# Identifies the deployed code; part of every page ETag (memorials.conditional),
+# so browsers don't revalidate old templates into 304s after a deploy
+RELEASE_VERSION = os.environ.get('RELEASE_VERSION') or os.environ.get('RAILWAY_DEPLOYMENT_ID', '')
+
+# Email (SMTP by default; EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend to print instead)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@memorialheritage.com')
+
+# Absolute links in emails
+SITE_URL = os.environ.get('SITE_URL', 'https://memohera.com')
+
+DIGEST_BATCH_SIZE = 100  # users per send_messages() call, see memorials.digest
+
+# Read notifications older than this move to NotificationArchive (prune_notifications)
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_PRUNE_BATCH_SIZE = 1000  # rows per transaction, see memorials.retention
+
+# Live badge counts over Server-Sent Events (memorials.live); needs an ASGI server
+INBOX_STREAM_POLL_INTERVAL = 5  # seconds between reads of the shared inbox versions
+INBOX_STREAM_REFRESH_INTERVAL = 300  # per-stream recount, cache then database
+INBOX_STREAM_KEEPALIVE = 25  # comment line so proxies don't drop idle streams
+INBOX_STREAM_MAX_AGE = 1800  # streams end after this; EventSource reconnects
+
+# Notifications created by requests are written behind, in batches (memorials.notifications)
+NOTIFICATION_WRITE_BEHIND = True
+NOTIFICATION_FLUSH_INTERVAL = 1.0  # seconds between flushes of the buffer
+NOTIFICATION_FLUSH_BATCH_SIZE = 500  # flush early once this many are waiting
+
+# Background jobs (memorials.jobs, manage.py run_worker)
+JOB_POLL_INTERVAL = 1.0  # seconds an idle worker thread waits before looking again
+JOB_RETRY_BACKOFF = 30  # seconds before the first retry; doubles with each attempt
+# Running jobs' locks are refreshed every quarter of this, so it bounds how long a
+# dead worker's job waits to be recovered, not how long a job may run
+JOB_LOCK_TIMEOUT = 600
@@ -7,18 +7,18 @@ from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from django.conf.urls.i18n import i18n_patterns
 from django.conf import settings
-from memorials.views_old import (
+from memorials.views import (
     home, create_memorial, browse_memorials, about, signup, my_memorials, 
     add_family_relationship, approve_family_relationship, logout_view,
     memorial_share, get_social_sharing_links, privacy_policy, change_password, edit_memorial,
     suggest_relationship, manage_relationship_suggestions, approve_relationship_suggestion,
     reject_relationship_suggestion, family_tree_view, notifications_list, mark_notification_read,
-    mark_all_notifications_read,  memorial_reminder_settings, upgrade_to_premium,
+    mark_all_notifications_read, inbox_stream,  memorial_reminder_settings, upgrade_to_premium,
     smart_match_suggestions, accept_smart_match, dismiss_smart_match, archive_all_smart_matches,
     pricing_page, create_checkout_session, payment_success, subscription_dashboard,
     cancel_subscription,memorial_photo_gallery,upload_memorial_photo,upload_multiple_memorial_photos,
     delete_memorial_photo,update_memorial_photo,reorder_memorial_photos,get_memorial_photos_json,
-    notification_settings
+    notification_settings, memorial_autocomplete, memorial_search_api
 )
 
 from memorials import webhook
@@ -66,6 +66,7 @@ urlpatterns += i18n_patterns(
     path('notifications/', notifications_list, name='notifications_list'),
     path('notification/<int:notification_id>/read/', mark_notification_read, name='mark_notification_read'),
     path('notifications/mark-all-read/', mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('notifications/stream/', inbox_stream, name='inbox_stream'),
 
     # Sharing URLs
     path('api/memorial/<int:memorial_id>/share-links/', get_social_sharing_links, name='get_social_sharing_links'),
@@ -101,6 +102,8 @@ urlpatterns += i18n_patterns(
     # AJAX/API endpoints
     path('memorial/<int:memorial_id>/photos/reorder/', reorder_memorial_photos, name='reorder_memorial_photos'),
     path('api/memorial/<int:memorial_id>/photos/', get_memorial_photos_json, name='get_memorial_photos_json'),
+    path('api/memorials/', memorial_search_api, name='memorial_search_api'),
+    path('api/memorials/autocomplete/', memorial_autocomplete, name='memorial_autocomplete'),
     prefix_default_language=False,
 )
 
@@ -2,7 +2,10 @@
 from django.contrib import admin
 from .models import Memorial
 from .models import Memorial, FamilyRelationship
-from memorials.models import PremiumPackage, UserSubscription, PaymentTransaction
+from memorials.models import PremiumPackage, UserSubscription, PaymentTransaction, Job
+from memorials.catalog import bump_catalog_version
+from memorials.family import bump_family_version
+from memorials.tasks import generate_smart_matches_for_memorial
 
 @admin.register(PremiumPackage)
 class PremiumPackageAdmin(admin.ModelAdmin):
@@ -17,6 +20,13 @@ class UserSubscriptionAdmin(admin.ModelAdmin):
 class PaymentTransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'amount', 'status', 'created_at')
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    # Finished jobs are deleted; what's left is queued, running or failed
+    list_display = ('task', 'status', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'task')
+    readonly_fields = ('last_error',)
+
 @admin.register(Memorial)
 class MemorialAdmin(admin.ModelAdmin):
     # What columns to show in the list view
@@ -61,12 +71,19 @@ class MemorialAdmin(admin.ModelAdmin):
     actions = ['approve_memorials', 'unapprove_memorials']
     
     def approve_memorials(self, request, queryset):
+        newly_approved = list(queryset.filter(approved=False).values_list('id', flat=True))
         updated = queryset.update(approved=True)
+        bump_catalog_version()  # update() skips the post_save receivers
+        bump_family_version()
+        for memorial_id in newly_approved:
+            generate_smart_matches_for_memorial.delay(memorial_id)  # as trigger_smart_matching would
         self.message_user(request, f'{updated} memorial(s) were approved.')
     approve_memorials.short_description = "Approve selected memorials"
     
     def unapprove_memorials(self, request, queryset):
         updated = queryset.update(approved=False)
+        bump_catalog_version()
+        bump_family_version()
         self.message_user(request, f'{updated} memorial(s) were unapproved.')
     unapprove_memorials.short_description = "Unapprove selected memorials"
     
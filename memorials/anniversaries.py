@@ -0,0 +1,431 @@
+# ============================================================================
+# anniversaries.py - Materialized anniversary calendar and daily reminders
+# ============================================================================
+#
+# The next CALENDAR_HORIZON_DAYS of reminders live in ScheduledNotification:
+# one row per (memorial, recipient, event, send date, days before). Events are
+# death anniversaries (milestone years get their own type), birthdays and the
+# memorial's MemorialReminderSettings.custom_reminder_date. Feb 29 dates are
+# observed on Feb 28 in common years.
+#
+# Who gets what:
+#   - the memorial owner's profile must be premium with anniversary
+#     notifications enabled; it picks the events (unless the memorial's
+#     reminder settings override death/birthday)
+#   - recipients are the owner, plus (unless notify_creator_only) the settings'
+#     specific_users and, with notify_all_family, the owners of every approved
+#     memorial in its family (memorials.family), deduplicated in one set
+#   - each recipient's own profile picks the timing (on the day, day before,
+#     week before)
+#
+# The calendar is kept current three ways: rebuild_calendar() for memorials
+# whose dates, settings or people changed (queued by the receivers below as
+# background jobs, see memorials.jobs, so saves don't wait on it),
+# extend_calendar() each day for the dates entering the horizon (an index
+# probe on the dob_md/dod_md MMDD keys), and build_calendar() for a full
+# rebuild (the build_anniversary_calendar command, and the daily command
+# on its first run, while the calendar is still empty). The daily job
+# then only reads today's unsent rows (send_scheduled_notifications) and
+# marks them sent in bulk.
+
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .family import family_memorial_ids, family_owner_ids
+from .jobs import shared_task
+from .models import (
+    FamilyRelationship, Memorial, MemorialReminderSettings, Notification, ScheduledNotification,
+    UserProfile, month_day,
+)
+from .notifications import create_notifications, dedupe_key
+
+CALENDAR_HORIZON_DAYS = 365
+
+# Death anniversaries in these years are sent as 'milestone_anniversary'
+# (UserProfile.notify_milestones)
+MILESTONE_YEARS = (1, 5, 10, 25, 50)
+
+# UserProfile timing preference and wording per number of days before the event
+TIMING = {
+    0: ('notify_on_day', 'today'),
+    1: ('notify_day_before', 'tomorrow'),
+    7: ('notify_week_before', 'in one week'),
+}
+
+PREFERENCES = (
+    'is_premium', 'enable_anniversary_notifications', 'notify_death_anniversaries',
+    'notify_birthdays', 'notify_milestones', 'notify_on_day', 'notify_day_before', 'notify_week_before',
+)
+
+
+# ----------------------------------------------------------------------------
+# Dates
+# ----------------------------------------------------------------------------
+
+def observed_date(base, year):
+    """The day in `year` on which the anniversary of `base` is observed"""
+    if (base.month, base.day) == (2, 29) and not calendar.isleap(year):
+        return date(year, 2, 28)
+    return base.replace(year=year)
+
+
+def observed_month_days(check_date):
+    """MMDD keys of the dates whose anniversary falls on `check_date`"""
+    keys = [month_day(check_date)]
+    if (check_date.month, check_date.day) == (2, 28) and not calendar.isleap(check_date.year):
+        keys.append(229)
+    return keys
+
+
+def occurrences(base, start, end):
+    """Anniversaries of `base` observed in [start, end], as (date, years since base)"""
+    for year in range(start.year, end.year + 1):
+        observed = observed_date(base, year)
+        if start <= observed <= end and observed >= base:
+            yield observed, year - base.year
+
+
+# ----------------------------------------------------------------------------
+# Building the calendar
+# ----------------------------------------------------------------------------
+
+def _profiles(user_ids):
+    """Preference dicts by user id; users without a profile get the field defaults"""
+    defaults = {name: UserProfile._meta.get_field(name).default for name in PREFERENCES}
+    profiles = dict.fromkeys(user_ids, defaults)
+    for row in UserProfile.objects.filter(user_id__in=user_ids).values('user_id', *PREFERENCES):
+        profiles[row.pop('user_id')] = row
+    return profiles
+
+
+def calendar_plans(memorial_ids):
+    """
+    What to materialize for each memorial in `memorial_ids` whose owner gets
+    reminders: dicts with memorial_id, base dates by event and
+    {recipient id: days-before offsets}. A fixed handful of queries per call,
+    whatever the number of memorials.
+    """
+    memorials = list(Memorial.objects.filter(id__in=memorial_ids).values('id', 'dob', 'dod', 'created_by_id'))
+    reminder_settings = {
+        row['memorial_id']: row
+        for row in MemorialReminderSettings.objects.filter(memorial_id__in=memorial_ids).values(
+            'id', 'memorial_id', 'custom_settings_enabled', 'notify_death_anniversary', 'notify_birthday',
+            'notify_creator_only', 'notify_all_family', 'custom_reminder_date',
+        )
+    }
+
+    # Recipients besides the owner, for memorials not limited to their creator
+    extra_recipients = defaultdict(set)
+    shared = {row['id']: memorial_id for memorial_id, row in reminder_settings.items() if not row['notify_creator_only']}
+    specific_users = MemorialReminderSettings.specific_users.through.objects.filter(
+        memorialremindersettings_id__in=shared
+    ).values_list('memorialremindersettings_id', 'user_id')
+    for settings_id, user_id in specific_users:
+        extra_recipients[shared[settings_id]].add(user_id)
+
+    # notify_all_family: owners of every memorial connected through approved
+    # relationships (one cached recursive query per family)
+    for memorial_id in shared.values():
+        if reminder_settings[memorial_id]['notify_all_family']:
+            extra_recipients[memorial_id].update(family_owner_ids(memorial_id))
+
+    user_ids = {memorial['created_by_id'] for memorial in memorials}
+    user_ids.update(*extra_recipients.values())
+    profiles = _profiles(user_ids)
+
+    for memorial in memorials:
+        owner = profiles[memorial['created_by_id']]
+        if not (owner['is_premium'] and owner['enable_anniversary_notifications']):
+            continue
+
+        settings_row = reminder_settings.get(memorial['id'])
+        custom = settings_row and settings_row['custom_settings_enabled']
+        notify_death = settings_row['notify_death_anniversary'] if custom else owner['notify_death_anniversaries']
+        notify_birthday = settings_row['notify_birthday'] if custom else owner['notify_birthdays']
+        recipients = {memorial['created_by_id']} | extra_recipients[memorial['id']]
+        yield {
+            'memorial_id': memorial['id'],
+            'death': memorial['dod'] if notify_death else None,
+            'milestones': memorial['dod'] if owner['notify_milestones'] else None,
+            'birthday': memorial['dob'] if notify_birthday else None,
+            'custom': settings_row['custom_reminder_date'] if settings_row else None,
+            'recipients': {
+                user_id: [days for days, (preference, _) in TIMING.items() if profiles[user_id][preference]]
+                for user_id in recipients
+            },
+        }
+
+
+def _events(plan, start, end):
+    """(notification type, event date, years) of the plan's events observed in [start, end]"""
+    if plan['death'] or plan['milestones']:
+        for observed, years in occurrences(plan['death'] or plan['milestones'], start, end):
+            if years == 0:
+                continue
+            if plan['milestones'] and years in MILESTONE_YEARS:
+                yield 'milestone_anniversary', observed, years
+            elif plan['death']:
+                yield 'death_anniversary', observed, years
+    if plan['birthday']:
+        for observed, years in occurrences(plan['birthday'], start, end):
+            if years:
+                yield 'birthday_anniversary', observed, years
+    if plan['custom']:
+        for observed, years in occurrences(plan['custom'], start, end):
+            yield 'custom_reminder', observed, years
+
+
+def calendar_entries(plan, start, end):
+    """Unsaved ScheduledNotifications for `plan` with send dates in [start, end]"""
+    events = list(_events(plan, start, end + timedelta(days=max(TIMING))))
+    for user_id, offsets in plan['recipients'].items():
+        for notification_type, event_date, years in events:
+            for days_before in offsets:
+                scheduled_date = event_date - timedelta(days=days_before)
+                if start <= scheduled_date <= end:
+                    yield ScheduledNotification(
+                        user_id=user_id,
+                        memorial_id=plan['memorial_id'],
+                        notification_type=notification_type,
+                        scheduled_date=scheduled_date,
+                        days_before=days_before,
+                        year_count=years,
+                    )
+
+
+def materialize_calendar(memorial_ids, start, end, batch_size=1000):
+    """
+    Insert the reminders of `memorial_ids` with send dates in [start, end].
+    Rows that already exist (sent ones included) are left alone. Yields the
+    running number of memorials done after each batch.
+    """
+    memorial_ids = list(memorial_ids)
+    for offset in range(0, len(memorial_ids), batch_size):
+        entries = [
+            entry
+            for plan in calendar_plans(memorial_ids[offset:offset + batch_size])
+            for entry in calendar_entries(plan, start, end)
+        ]
+        ScheduledNotification.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+        yield min(offset + batch_size, len(memorial_ids))
+
+
+@shared_task
+def rebuild_calendar(memorial_ids, today=None):
+    """Replace the unsent reminders of `memorial_ids` after their dates, settings or people changed"""
+    today = today or timezone.localdate()
+    memorial_ids = list(memorial_ids)
+    with transaction.atomic():
+        ScheduledNotification.objects.filter(
+            memorial_id__in=memorial_ids, is_sent=False, scheduled_date__gte=today
+        ).delete()
+        for _ in materialize_calendar(memorial_ids, today, today + timedelta(days=CALENDAR_HORIZON_DAYS)):
+            pass
+
+
+def build_calendar(today=None, batch_size=1000):
+    """
+    Replace every unsent reminder from `today` on, in one transaction.
+    Yields the running number of memorials done after each batch.
+    """
+    today = today or timezone.localdate()
+    memorial_ids = list(Memorial.objects.order_by('id').values_list('id', flat=True))
+    with transaction.atomic():
+        ScheduledNotification.objects.filter(is_sent=False, scheduled_date__gte=today).delete()
+        yield from materialize_calendar(
+            memorial_ids, today, today + timedelta(days=CALENDAR_HORIZON_DAYS), batch_size=batch_size,
+        )
+
+
+def calendar_needs_build():
+    """
+    True while the calendar was never built: nothing was ever scheduled,
+    although some premium user gets reminders
+    """
+    return (
+        not ScheduledNotification.objects.exists()
+        and UserProfile.objects.filter(is_premium=True, enable_anniversary_notifications=True).exists()
+    )
+
+
+def extend_calendar(today=None, days=7):
+    """
+    Materialize the send dates entering the horizon: its last `days` days, a
+    few days of slack in case the job missed a run. Only memorials with an
+    event on those dates are looked at, through an index probe on dob_md/dod_md.
+    Returns the number of memorials looked at.
+    """
+    today = today or timezone.localdate()
+    end = today + timedelta(days=CALENDAR_HORIZON_DAYS)
+    start = end - timedelta(days=days - 1)
+
+    event_dates = [start + timedelta(days=offset) for offset in range(days + max(TIMING))]
+    keys = {key for event_date in event_dates for key in observed_month_days(event_date)}
+    memorial_ids = set(Memorial.objects.filter(dob_md__in=keys).values_list('id', flat=True))
+    memorial_ids.update(Memorial.objects.filter(dod_md__in=keys).values_list('id', flat=True))
+    memorial_ids.update(
+        memorial_id
+        for memorial_id, custom_date in MemorialReminderSettings.objects.filter(
+            custom_reminder_date__isnull=False
+        ).values_list('memorial_id', 'custom_reminder_date')
+        if month_day(custom_date) in keys
+    )
+
+    for _ in materialize_calendar(sorted(memorial_ids), start, end):
+        pass
+    return len(memorial_ids)
+
+
+# ----------------------------------------------------------------------------
+# Sending
+# ----------------------------------------------------------------------------
+
+def build_notification(notification_type, memorial_id, full_name, user_id, event_date, years, days_before, label=''):
+    timing = TIMING[days_before][1]
+    when = event_date.strftime('%B %d, %Y')
+    if notification_type == 'birthday_anniversary':
+        title = f"Birthday Coming: {full_name}"
+        message = f"{full_name} would have been {years} years old {timing} ({when})."
+    elif notification_type == 'custom_reminder':
+        title = f"Reminder: {label or full_name}"
+        message = f"{label or 'Your reminder'} for {full_name} is {timing} ({when})."
+    else:
+        kind = 'Milestone' if notification_type == 'milestone_anniversary' else 'Upcoming'
+        title = f"{kind} Anniversary: {full_name}"
+        message = f"The {years}-year anniversary of {full_name}'s passing is {timing} ({when})."
+    return Notification(
+        user_id=user_id,
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        related_memorial_id=memorial_id,
+        action_url=f'/memorial/{memorial_id}/family-tree/',
+        dedupe_key=dedupe_key(notification_type, memorial_id, event_date.isoformat(), days_before),
+    )
+
+
+def send_scheduled_notifications(today=None, batch_size=1000):
+    """
+    Turn today's unsent calendar rows into Notifications: each batch is read
+    through scheduled_unsent_idx, then inserted and marked sent with one bulk
+    INSERT and one UPDATE in a transaction. Yields the rows sent per batch.
+    """
+    today = today or timezone.localdate()
+    due = ScheduledNotification.objects.filter(scheduled_date=today, is_sent=False).order_by('id').values_list(
+        'id', 'notification_type', 'memorial_id', 'memorial__full_name', 'user_id', 'year_count', 'days_before',
+        'memorial__memorialremindersettings__custom_reminder_label',
+    )
+    last_id = 0
+    while True:
+        rows = list(due.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        with transaction.atomic():
+            create_notifications([
+                build_notification(
+                    notification_type, memorial_id, full_name, user_id,
+                    today + timedelta(days=days_before), years, days_before, label,
+                )
+                for _, notification_type, memorial_id, full_name, user_id, years, days_before, label in rows
+            ])
+            ScheduledNotification.objects.filter(id__in=[row[0] for row in rows]).update(
+                is_sent=True, sent_at=timezone.now()
+            )
+        yield len(rows)
+
+
+# ----------------------------------------------------------------------------
+# Keep the calendar current
+# ----------------------------------------------------------------------------
+
+def queue_rebuild(memorial_ids):
+    """
+    Queue rebuild_calendar() as a background job. The job row is part of the
+    current transaction, so the worker runs it after commit: by then a
+    cascading delete has removed the memorial too, instead of the rebuild
+    re-inserting rows for it.
+    """
+    memorial_ids = sorted(set(memorial_ids))
+    if memorial_ids:
+        rebuild_calendar.delay(memorial_ids)
+
+
+@shared_task
+def rebuild_user_calendar(user_id):
+    """Rebuild the user's memorials and every memorial they have reminders for"""
+    memorial_ids = set(Memorial.objects.filter(created_by_id=user_id).values_list('id', flat=True))
+    memorial_ids.update(
+        ScheduledNotification.objects.filter(user_id=user_id, is_sent=False).values_list('memorial_id', flat=True)
+    )
+    if memorial_ids:
+        rebuild_calendar(memorial_ids)
+
+
+@shared_task
+def rebuild_family_calendars(*person_ids):
+    """Rebuild the memorials that notify all family, in the families of `person_ids`"""
+    # Resolved when the job runs, against the new graph: a deleted
+    # relationship may have split one family into two
+    memorial_ids = list(MemorialReminderSettings.objects.filter(
+        memorial_id__in=family_memorial_ids(*person_ids),
+        notify_creator_only=False,
+        notify_all_family=True,
+    ).values_list('memorial_id', flat=True))
+    if memorial_ids:
+        rebuild_calendar(memorial_ids)
+
+
+@receiver(post_save, sender=Memorial)
+def memorial_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """New memorials and changed dates or owners"""
+    if raw:
+        return
+    if created or update_fields is None or {'dob', 'dod', 'created_by'} & set(update_fields):
+        queue_rebuild([instance.pk])
+
+
+@receiver(post_save, sender=MemorialReminderSettings)
+@receiver(post_delete, sender=MemorialReminderSettings)
+def reminder_settings_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    queue_rebuild([instance.memorial_id])
+
+
+@receiver(m2m_changed, sender=MemorialReminderSettings.specific_users.through)
+def reminder_recipients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the user's side (user.memorial_reminders): pk_set holds settings ids
+        queue_rebuild(
+            MemorialReminderSettings.objects.filter(pk__in=pk_set or ()).values_list('memorial_id', flat=True)
+        )
+    else:
+        queue_rebuild([instance.memorial_id])
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Preferences pick the events of the user's memorials and the timing of everything they receive"""
+    if raw:
+        return
+    if update_fields is not None and not set(PREFERENCES) & set(update_fields):
+        return
+    rebuild_user_calendar.delay(instance.user_id)
+
+
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def relatives_changed(sender, instance, raw=False, **kwargs):
+    """Memorials that notify all family reach the owners of every connected memorial"""
+    if raw:
+        return
+    rebuild_family_calendars.delay(instance.person_a_id, instance.person_b_id)
@@ -1,9 +1,20 @@
 from django.apps import AppConfig
 
 class MemorialsConfig(AppConfig):
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'memorials'
 
+    def ready(self):
+        from . import anniversaries  # noqa: F401 - registers the anniversary calendar receivers
+        from . import catalog  # noqa: F401 - registers the catalog version receivers
+        from . import conditional  # noqa: F401 - registers the updated_at receivers
+        from . import family  # noqa: F401 - registers the family cache receivers
+        from . import inbox  # noqa: F401 - registers the inbox counter receivers
+        from . import live  # noqa: F401 - registers the live badge publisher
+        from . import search  # noqa: F401 - registers the search index receivers
+        from . import signals  # noqa: F401 - registers the smart matching trigger
+
 class YourAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'your_app_name'
@@ -0,0 +1,320 @@
+# ============================================================================
+# browse.py - Helpers for the public browse page
+# ============================================================================
+
+import hashlib
+import json
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, ExpressionWrapper, F, IntegerField
+from django.utils.translation import gettext_lazy as _
+from django_countries import countries
+
+from .caching import cache_aside, versioned_key
+from .catalog import CATALOG_NAMESPACE
+from .search import search_memorials
+
+BROWSE_PAGE_SIZE = 20
+DEFAULT_SORT = '-created_at'
+
+# JSON search API (memorial_search_api): selectable ?fields= and page sizes
+API_FIELDS = (
+    'id', 'full_name', 'dob', 'dod', 'country', 'story',
+    'birth_year', 'death_year', 'created_at',
+)
+API_DEFAULT_FIELDS = ('id', 'full_name', 'dob', 'dod', 'country')
+API_MAX_PAGE_SIZE = 100
+API_EXPORT_CHUNK_SIZE = 2000
+
+# Declared sort modes for ?sort=. Each maps to a keyset ordering ending in id
+# (so ties page stably) and to the composite Memorial index that serves it;
+# the opposite direction scans the same index backwards. Relevance is ordered
+# by the computed search rank, within the (already narrow) search results.
+SORT_MODES = {
+    'relevance': {
+        'label': _('Most Relevant'),
+        'ordering': ('-search_rank', '-created_at', '-id'),
+        'index': None,
+    },
+    '-created_at': {
+        'label': _('Newest First'),
+        'ordering': ('-created_at', '-id'),
+        'index': 'memorial_browse_created_idx',
+    },
+    'created_at': {
+        'label': _('Oldest First'),
+        'ordering': ('created_at', 'id'),
+        'index': 'memorial_browse_created_idx',
+    },
+    'full_name': {
+        'label': _('Name A-Z'),
+        'ordering': ('full_name', 'id'),
+        'index': 'memorial_browse_name_idx',
+    },
+    '-full_name': {
+        'label': _('Name Z-A'),
+        'ordering': ('-full_name', '-id'),
+        'index': 'memorial_browse_name_idx',
+    },
+    'dob': {
+        'label': _('Born Earliest'),
+        'ordering': ('dob', 'id'),
+        'index': 'memorial_browse_dob_idx',
+    },
+    '-dob': {
+        'label': _('Born Latest'),
+        'ordering': ('-dob', '-id'),
+        'index': 'memorial_browse_dob_idx',
+    },
+    'dod': {
+        'label': _('Died Earliest'),
+        'ordering': ('dod', 'id'),
+        'index': 'memorial_browse_dod_idx',
+    },
+    '-dod': {
+        'label': _('Died Latest'),
+        'ordering': ('-dod', '-id'),
+        'index': 'memorial_browse_dod_idx',
+    },
+}
+
+
+def resolve_sort(sort, query=''):
+    """Return a declared sort mode key; searches default to relevance"""
+    if not sort:
+        return 'relevance' if query else DEFAULT_SORT
+    if sort not in SORT_MODES or (sort == 'relevance' and not query):
+        return DEFAULT_SORT
+    return sort
+
+
+def available_sort_modes(query=''):
+    """(key, label) pairs for the sort dropdown"""
+    return [
+        (key, mode['label']) for key, mode in SORT_MODES.items()
+        if key != 'relevance' or query
+    ]
+
+
+# ----------------------------------------------------------------------------
+# Filters
+# ----------------------------------------------------------------------------
+
+YEAR_RANGE_RE = re.compile(r'^\s*(\d{1,4})?\s*(?:([-\u2013\u2014])\s*(\d{1,4})?)?\s*$')
+
+
+def parse_year_range(value):
+    """
+    Parse '1950', '1900-1920' (hyphen or en dash), '1900-' or '-1920'
+    into an inclusive (start, end) tuple; either end may be None.
+    Returns None for empty or invalid input.
+    """
+    match = YEAR_RANGE_RE.match(value or '')
+    if not match:
+        return None  # Ignore invalid year input
+    start, dash, end = match.groups()
+    start = int(start) if start else None
+    end = int(end) if end else None
+    if not dash:
+        end = start  # a single year
+    if start is None and end is None:
+        return None
+    if start is not None and end is not None and start > end:
+        start, end = end, start
+    return (start, end)
+
+
+def parse_browse_filters(params):
+    """Read the browse filters from a GET QueryDict into a normalized dict"""
+    return {
+        'q': ' '.join(params.get('q', '').split()),
+        'country': params.get('country', '').strip().upper(),
+        'birth_year': parse_year_range(params.get('birth_year')),
+        'death_year': parse_year_range(params.get('death_year')),
+    }
+
+
+def _filter_year_range(queryset, field, year_range):
+    """Range filter on a stored year column, so it stays an index range scan"""
+    start, end = year_range
+    if start == end:
+        return queryset.filter(**{field: start})
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    return queryset
+
+
+def filter_memorials(queryset, filters):
+    """Apply normalized browse filters to a Memorial queryset"""
+    if filters['q']:
+        queryset = search_memorials(queryset, filters['q'])
+    if filters['country']:
+        queryset = queryset.filter(country=filters['country'])
+    if filters['birth_year']:
+        queryset = _filter_year_range(queryset, 'birth_year', filters['birth_year'])
+    if filters['death_year']:
+        queryset = _filter_year_range(queryset, 'death_year', filters['death_year'])
+    return queryset
+
+
+def filter_signature(filters):
+    """Stable hash of a normalized filter dict, for cache keys"""
+    canonical = dict(filters, q=filters['q'].casefold())
+    payload = json.dumps(canonical, sort_keys=True)
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def browse_cache_key(kind, filters, *parts):
+    """
+    Cache key for browse data derived from `filters`, e.g. 'catalog:<version>:browse-count:<sig>'.
+    It embeds the catalog version, so bumping the version invalidates every key at once.
+    """
+    return versioned_key(CATALOG_NAMESPACE, f'browse-{kind}', filter_signature(filters), *parts)
+
+
+def results_cache_key(filters, sort, cursor, language):
+    """Key of one rendered page of browse results; pass '' for an unsigned cursor"""
+    position = hashlib.md5(cursor.encode('utf-8')).hexdigest() if cursor else 'first'
+    return browse_cache_key('results', filters, sort, position, language)
+
+
+def parse_api_fields(value):
+    """
+    Read a comma separated ?fields= list into a tuple of API_FIELDS names.
+    Empty input gives API_DEFAULT_FIELDS; unknown names raise ValueError.
+    """
+    fields = tuple(dict.fromkeys(name.strip() for name in (value or '').split(',') if name.strip()))
+    if not fields:
+        return API_DEFAULT_FIELDS
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(API_FIELDS)}")
+    return fields
+
+
+def parse_page_size(value, default=BROWSE_PAGE_SIZE, maximum=API_MAX_PAGE_SIZE):
+    """?limit= as an int between 1 and `maximum`; falls back to `default`"""
+    try:
+        return max(1, min(int(value), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+# ----------------------------------------------------------------------------
+# Result counts
+# ----------------------------------------------------------------------------
+
+def planner_estimate(queryset):
+    """Row estimate from the PostgreSQL planner, or None on other databases"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _round_estimate(value):
+    """Round to two significant figures, e.g. 123456 -> 120000"""
+    magnitude = 10 ** max(len(str(value)) - 2, 0)
+    return round(value / magnitude) * magnitude
+
+
+def get_result_count(queryset, filters):
+    """
+    Return (count, is_approximate) for a filtered browse queryset.
+    Counts are cached per filter signature and catalog version; on PostgreSQL,
+    results the planner expects to be large use its estimate instead of an
+    exact COUNT(*).
+    """
+    def count():
+        threshold = getattr(settings, 'BROWSE_APPROXIMATE_COUNT_THRESHOLD', 10000)
+        estimate = planner_estimate(queryset)
+        if estimate is not None and estimate >= threshold:
+            return (_round_estimate(estimate), True)
+        return (queryset.count(), False)
+
+    result = cache_aside(
+        browse_cache_key('count', filters), count,
+        timeout=getattr(settings, 'BROWSE_COUNT_CACHE_TIMEOUT', 300),
+    )
+    return tuple(result)
+
+
+# ----------------------------------------------------------------------------
+# Facets
+# ----------------------------------------------------------------------------
+
+def _decade(field):
+    return ExpressionWrapper(F(field) / 10 * 10, output_field=IntegerField())
+
+
+def _decade_facets(counter):
+    return [
+        {'value': f'{decade}-{decade + 9}', 'label': f'{decade}s', 'count': total}
+        for decade, total in sorted(counter.items())
+    ]
+
+
+# Facet -> the browse filter that narrows it
+FACET_FILTERS = {'country': 'country', 'birth_decade': 'birth_year', 'death_decade': 'death_year'}
+
+
+def get_facets(queryset, filters):
+    """
+    Non-empty facet counts for country, birth decade and death decade.
+    `queryset` is the unfiltered base; each facet is counted with every filter
+    except its own, so a chosen country or decade still lists the others.
+    One GROUP BY (country, birth decade, death decade) query is folded into
+    the three facets in Python, plus one more per facet whose own filter is
+    set; the result is cached per filter signature and catalog version.
+    """
+    def count():
+        facets = _count_facets(filter_memorials(queryset, filters))
+        for facet, key in FACET_FILTERS.items():
+            if filters[key]:
+                facets[facet] = _count_facets(filter_memorials(queryset, dict(filters, **{key: None})))[facet]
+        return facets
+
+    return cache_aside(
+        browse_cache_key('facets', filters), count,
+        timeout=getattr(settings, 'BROWSE_COUNT_CACHE_TIMEOUT', 300),
+    )
+
+
+def _count_facets(queryset):
+    rows = (
+        queryset.order_by()
+        .values('country', birth_decade=_decade('birth_year'), death_decade=_decade('death_year'))
+        .annotate(total=Count('id'))
+    )
+
+    by_country, by_birth, by_death = Counter(), Counter(), Counter()
+    for row in rows:
+        by_country[row['country']] += row['total']
+        if row['birth_decade'] is not None:
+            by_birth[row['birth_decade']] += row['total']
+        if row['death_decade'] is not None:
+            by_death[row['death_decade']] += row['total']
+
+    return {
+        'country': sorted(
+            (
+                {'value': code, 'label': countries.name(code) or code, 'count': total}
+                for code, total in by_country.items() if code
+            ),
+            key=lambda facet: (-facet['count'], facet['label']),
+        ),
+        'birth_decade': _decade_facets(by_birth),
+        'death_decade': _decade_facets(by_death),
+    }
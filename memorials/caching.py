@@ -0,0 +1,91 @@
+# ============================================================================
+# caching.py - Cache-aside helpers with versioned keys
+# ============================================================================
+#
+# Cached values are read through cache_aside(): look the key up, and on a miss
+# compute the value and store it. Keys embed the version of a namespace (see
+# versioned_key); bump_version() invalidates everything in the namespace at
+# once, and the orphaned entries just expire.
+#
+# Aliases (settings.CACHES): 'default' for general data, 'fragments' for
+# rendered HTML, 'counters' for version numbers and other small hot values,
+# 'sessions' for the session store. 'counters' must be shared by every
+# process that writes or reads cached data (Redis, or the database table).
+
+import logging
+import random
+import time
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+VERSION_ALIAS = 'counters'
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def _new_version():
+    # Millisecond clock rather than 1, plus random low digits: every bump writes a
+    # value no process has used before, so neither an evicted version key nor two
+    # bumps racing on different hosts can bring back a version whose entries are
+    # still cached
+    return int(time.time() * 1000) * 1000 + random.randrange(1000)
+
+
+def get_version(namespace):
+    """Current version of `namespace`, created on first use"""
+    cache = caches[VERSION_ALIAS]
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(namespaces):
+    """{namespace: version} in one round trip; namespaces never used are None (nothing is created)"""
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = caches[VERSION_ALIAS].get_many(keys)
+    return {namespace: found.get(key) for key, namespace in keys.items()}
+
+
+def bump_version(namespace):
+    """
+    Invalidate every key built with versioned_key(namespace, ...). A single
+    set() of a fresh version rather than incr(), which is a non-atomic get and
+    set on the file and database caches: two racing increments could both
+    write the same number, and an entry cached between them would survive.
+    """
+    version = _new_version()
+    caches[VERSION_ALIAS].set(_version_key(namespace), version, timeout=None)
+    return version
+
+
+def versioned_key(namespace, *parts):
+    """'<namespace>:<version>:<parts...>', e.g. 'catalog:1718000000000:browse-count:<sig>'"""
+    return ':'.join([namespace, str(get_version(namespace)), *map(str, parts)])
+
+
+def cache_aside(key, compute, alias='default', timeout=None, log_level=logging.DEBUG):
+    """
+    Return the value cached at `key` in cache `alias`; on a miss call compute(),
+    store its result for `timeout` seconds (the alias default if None) and return it.
+    compute() must not return None, which the cache can't tell apart from a miss.
+    """
+    cache = caches[alias]
+    value = cache.get(key)
+    if value is not None:
+        logger.log(log_level, 'Cache hit [%s]: %s', alias, key)
+        return value
+
+    logger.log(log_level, 'Cache miss [%s]: %s', alias, key)
+    value = compute()
+    if timeout is None:
+        cache.set(key, value)
+    else:
+        cache.set(key, value, timeout)
+    return value
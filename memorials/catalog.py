@@ -0,0 +1,47 @@
+# ============================================================================
+# catalog.py - Global version counter for cached public memorial listings
+# ============================================================================
+#
+# Cached browse fragments, counts and facets embed the current catalog version
+# in their keys. Any change that can alter what browse shows (approving,
+# editing or deleting a memorial, its photos or its relationships) bumps the
+# version, which orphans every old entry at once instead of hunting them down;
+# orphans simply expire.
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_version, get_version
+from .models import FamilyRelationship, Memorial, MemorialPhoto
+
+CATALOG_NAMESPACE = 'catalog'
+
+
+def get_catalog_version():
+    """Current catalog version; build keys with caching.versioned_key(CATALOG_NAMESPACE, ...)"""
+    return get_version(CATALOG_NAMESPACE)
+
+
+def bump_catalog_version():
+    """Invalidate every cached listing; call after bulk .update()s that skip signals"""
+    return bump_version(CATALOG_NAMESPACE)
+
+
+@receiver(post_save, sender=Memorial)
+def memorial_saved(sender, instance, created, raw=False, **kwargs):
+    """post_save receiver: a new pending memorial isn't listed anywhere yet"""
+    if raw or (created and not instance.approved):
+        return
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Memorial)
+@receiver(post_save, sender=MemorialPhoto)
+@receiver(post_delete, sender=MemorialPhoto)
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def catalog_changed(sender, raw=False, **kwargs):
+    """Photos and relationships are rendered on browse cards too"""
+    if raw:
+        return
+    bump_catalog_version()
@@ -0,0 +1,122 @@
+# ============================================================================
+# conditional.py - Modification tracking and conditional GET for memorial pages
+# ============================================================================
+#
+# Memorial.updated_at moves whenever the memorial or something its pages show
+# changes: its own saves (auto_now), its photos (MemorialPhoto.save/delete and
+# refresh_photo_summary), its relationships and its owner's subscription (the
+# receivers below). Views wrap themselves in django.views.decorators.http.condition()
+# with the functions here, so a revalidating browser or proxy gets a 304
+# instead of the page.
+#
+# Public JSON only depends on the memorial, so it gets Last-Modified plus an
+# ETag. HTML pages also show the viewer (navbar, badge counts, CSRF token,
+# language), so their ETag folds those in and they get no Last-Modified: a
+# date alone can't tell two users' copies apart.
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import get_language
+
+from .caching import get_version
+from .catalog import CATALOG_NAMESPACE
+from .models import FamilyRelationship, Memorial, UserSubscription
+
+
+def memorial_updated_at(request, memorial_id):
+    """updated_at of the approved memorial `memorial_id` (None if there is none), looked up once per request"""
+    lookups = request.__dict__.setdefault('_memorial_updated_at', {})
+    if memorial_id not in lookups:
+        lookups[memorial_id] = Memorial.objects.filter(
+            id=memorial_id, approved=True
+        ).values_list('updated_at', flat=True).first()
+    return lookups[memorial_id]
+
+
+def _digest(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def page_etag(request, *parts):
+    """
+    ETag for an HTML page built from `parts`, scoped to the viewer. None (no
+    conditional handling) while flash messages are waiting to be shown.
+    """
+    if len(get_messages(request)):
+        return None
+
+    # A first visit has no CSRF cookie yet; settle the secret the page will embed
+    # (and set as the cookie) so the next request's ETag matches this one
+    get_token(request)
+
+    user_id = request.user.pk if request.user.is_authenticated else ''
+    return _digest(
+        getattr(settings, 'RELEASE_VERSION', ''),
+        get_language(),
+        user_id,
+        get_version(f'inbox:{user_id}') if user_id else '',
+        request.META.get('CSRF_COOKIE', ''),
+        *parts,
+    )
+
+
+# ----------------------------------------------------------------------------
+# condition() functions, called with the view's arguments
+# ----------------------------------------------------------------------------
+
+def memorial_json_last_modified(request, memorial_id):
+    return memorial_updated_at(request, memorial_id)
+
+
+def memorial_json_etag(request, memorial_id):
+    updated_at = memorial_updated_at(request, memorial_id)
+    if updated_at is None:
+        return None
+    return _digest(getattr(settings, 'RELEASE_VERSION', ''), memorial_id, updated_at.isoformat())
+
+
+def memorial_page_etag(request, memorial_id):
+    """Pages that show one memorial and its photos (the photo gallery)"""
+    updated_at = memorial_updated_at(request, memorial_id)
+    if updated_at is None:
+        return None
+    return page_etag(request, memorial_id, updated_at.isoformat())
+
+
+def family_tree_etag(request, memorial_id):
+    """
+    The tree reaches three relationships deep, so any relative's change shows up
+    in it; the catalog version (bumped by every memorial, photo and relationship
+    change) covers that without walking the tree.
+    """
+    updated_at = memorial_updated_at(request, memorial_id)
+    if updated_at is None:
+        return None
+    return page_etag(request, memorial_id, updated_at.isoformat(), get_version(CATALOG_NAMESPACE))
+
+
+# ----------------------------------------------------------------------------
+# Touch memorials on related writes
+# ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def relationship_changed(sender, instance, raw=False, **kwargs):
+    """Both memorials list the relationship"""
+    if raw:
+        return
+    Memorial.objects.filter(id__in=[instance.person_a_id, instance.person_b_id]).touch()
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def subscription_changed(sender, instance, raw=False, **kwargs):
+    """The photo gallery shows the owner's premium status and photo allowance"""
+    if raw:
+        return
+    Memorial.objects.filter(created_by_id=instance.user_id).touch()
@@ -0,0 +1,109 @@
+# ============================================================================
+# digest.py - Daily digest emails of unread notifications
+# ============================================================================
+#
+# One email per user per day, listing that day's notifications they haven't
+# read (and haven't been emailed about). Users opt in with
+# UserProfile.email_daily_digest on the notification settings page.
+#
+# Sending is batched: the templates are compiled once per run, users are
+# loaded a batch at a time, and the whole run shares one SMTP connection, so
+# the handshake (and TLS/auth) is paid once rather than per recipient. Each
+# message is still sent on its own, so a refused recipient only loses their
+# digest: their notifications stay pending while everyone else's are stamped
+# emailed_at. A dropped connection ends the run; what went out before it is
+# stamped, the rest is left for the next run.
+
+import logging
+import smtplib
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+DIGEST_TEMPLATE = 'registration/notifications/daily_digest_email'
+
+# Errors that reject one message but leave the connection usable
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def day_bounds(day):
+    """[start, end) of the local calendar day `day`, as aware datetimes"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def pending_notifications(day):
+    """Unread notifications created on `day` that no digest has covered, for users who want one"""
+    start, end = day_bounds(day)
+    return Notification.objects.filter(
+        created_at__gte=start, created_at__lt=end, is_read=False, emailed_at__isnull=True,
+        user__is_active=True, user__userprofile__email_daily_digest=True,
+    ).exclude(user__email='')
+
+
+def build_digest(user, notifications, templates, day):
+    """The digest message for `user`, rendered from the pre-compiled (text, html) `templates`"""
+    context = {
+        'user': user,
+        'day': day,
+        'notifications': notifications,
+        'total': len(notifications),
+        'site_url': settings.SITE_URL.rstrip('/'),
+    }
+    text_template, html_template = templates
+    count = len(notifications)
+    message = EmailMultiAlternatives(
+        subject=f"Your Memorial Heritage digest: {count} new notification{'s' if count != 1 else ''}",
+        body=text_template.render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+    message.attach_alternative(html_template.render(context), 'text/html')
+    return message
+
+
+def send_daily_digests(day=None, batch_size=None, connection=None):
+    """
+    Email every user their digest for `day` (default: yesterday, so the whole
+    day is in). Yields the number of messages sent per batch.
+    """
+    day = day or timezone.localdate() - timedelta(days=1)
+    batch_size = batch_size or settings.DIGEST_BATCH_SIZE
+    pending = pending_notifications(day)
+    user_ids = list(pending.order_by('user_id').values_list('user_id', flat=True).distinct())
+    if not user_ids:
+        return
+
+    templates = (get_template(f'{DIGEST_TEMPLATE}.txt'), get_template(f'{DIGEST_TEMPLATE}.html'))
+    connection = connection or get_connection(fail_silently=False)
+
+    with connection:
+        for offset in range(0, len(user_ids), batch_size):
+            batch = pending.filter(
+                user_id__in=user_ids[offset:offset + batch_size]
+            ).select_related('user').order_by('user_id', 'created_at')
+
+            sent, emailed_ids = 0, []
+            try:
+                for _, group in groupby(batch, key=lambda notification: notification.user_id):
+                    notifications = list(group)
+                    message = build_digest(notifications[0].user, notifications, templates, day)
+                    try:
+                        if not connection.send_messages([message]):
+                            continue
+                    except MESSAGE_ERRORS:
+                        logger.warning('Daily digest to user %s was refused', notifications[0].user_id, exc_info=True)
+                        continue
+                    sent += 1
+                    emailed_ids.extend(notification.id for notification in notifications)
+            finally:
+                Notification.objects.filter(id__in=emailed_ids).update(emailed_at=timezone.now())
+            yield sent
@@ -0,0 +1,93 @@
+# ============================================================================
+# family.py - Connected families over the FamilyRelationship graph
+# ============================================================================
+#
+# A memorial's family is every memorial reachable from it through approved
+# relationships, in either direction. connected_family() resolves it with one
+# recursive query (WITH RECURSIVE, on PostgreSQL and SQLite alike); UNION
+# rather than UNION ALL keeps cycles from looping.
+#
+# family_owner_ids() caches the owners per memorial. All memorials of a
+# family share the same set, so one query fills the cache for the whole
+# family. Keys carry the 'family' version, bumped by any change to the graph
+# or to a memorial's owner or approval (bulk updates call bump_family_version).
+
+from django.core.cache import caches
+from django.db import connections, router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_version, cache_aside, versioned_key
+from .models import FamilyRelationship, Memorial
+
+FAMILY_NAMESPACE = 'family'
+
+CONNECTED_FAMILY_SQL = """
+    WITH RECURSIVE family(id) AS (
+        SELECT %s
+        UNION
+        SELECT CASE WHEN rel.person_a_id = family.id THEN rel.person_b_id ELSE rel.person_a_id END
+        FROM family
+        JOIN {relationships} AS rel ON rel.person_a_id = family.id OR rel.person_b_id = family.id
+        WHERE rel.status = 'approved'
+    )
+    SELECT memorial.id, memorial.created_by_id, memorial.approved
+    FROM family JOIN {memorials} AS memorial ON memorial.id = family.id
+"""
+
+
+def connected_family(memorial_id):
+    """(id, owner id, approved) of every memorial connected to `memorial_id`, itself included"""
+    connection = connections[router.db_for_read(FamilyRelationship)]
+    sql = CONNECTED_FAMILY_SQL.format(
+        relationships=connection.ops.quote_name(FamilyRelationship._meta.db_table),
+        memorials=connection.ops.quote_name(Memorial._meta.db_table),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [memorial_id])
+        return cursor.fetchall()
+
+
+def family_owner_ids(memorial_id):
+    """Owners of the approved memorials in `memorial_id`'s family (a cached frozenset)"""
+    prefix = versioned_key(FAMILY_NAMESPACE, 'owners')
+
+    def owners():
+        family = connected_family(memorial_id)
+        owner_ids = frozenset(owner_id for _, owner_id, approved in family if approved)
+        # The rest of the family shares the same owners: fill their keys too
+        caches['default'].set_many({f'{prefix}:{member_id}': owner_ids for member_id, _, _ in family})
+        return owner_ids
+
+    return cache_aside(f'{prefix}:{memorial_id}', owners)
+
+
+def family_memorial_ids(*memorial_ids):
+    """Ids of every memorial connected to any of `memorial_ids` (uncached)"""
+    found = set()
+    for memorial_id in memorial_ids:
+        if memorial_id not in found:
+            found.update(member_id for member_id, _, _ in connected_family(memorial_id))
+    return found
+
+
+def bump_family_version():
+    """Invalidate every cached family; call after bulk .update()s that skip signals"""
+    return bump_version(FAMILY_NAMESPACE)
+
+
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def relationship_changed(sender, raw=False, **kwargs):
+    if raw:
+        return
+    bump_family_version()
+
+
+@receiver(post_save, sender=Memorial)
+def memorial_saved(sender, created, raw=False, update_fields=None, **kwargs):
+    """A new memorial has no relationships yet; edits may change its owner or approval"""
+    if raw or created:
+        return
+    if update_fields is None or {'approved', 'created_by'} & set(update_fields):
+        bump_family_version()
@@ -7,6 +7,7 @@ import datetime
 from django.forms import modelformset_factory, inlineformset_factory
 from .models import MemorialPhoto, Memorial
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from PIL import Image
 from io import BytesIO
 
@@ -199,6 +200,44 @@ class MemorialEditWithPhotosForm(forms.ModelForm):
 ##################################################################
 
 
+class MemorialAutocompleteSelect(forms.Select):
+    """
+    <select> for picking a memorial by name. Only the current selection is rendered;
+    memorial_autocomplete.js fetches the other options from the autocomplete endpoint
+    as the user types, so the page never loads every memorial the user owns.
+    """
+
+    class Media:
+        js = ['js/memorial_autocomplete.js']
+
+    def __init__(self, attrs=None, scope='mine', exclude=None):
+        super().__init__(attrs)
+        self.scope = scope
+        self.exclude = exclude
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-autocomplete-url'] = reverse('memorial_autocomplete')
+        attrs['data-autocomplete-scope'] = self.scope
+        if self.exclude:
+            attrs['data-autocomplete-exclude'] = self.exclude
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        """The empty choice plus the selected memorial only, instead of the whole queryset"""
+        selected = [str(v) for v in value if str(v).isdigit()]
+        field = self.choices.field
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, not selected, 0))
+        if selected:
+            for memorial in self.choices.queryset.filter(pk__in=selected):
+                options.append(self.create_option(
+                    name, memorial.pk, field.label_from_instance(memorial), True, len(options)
+                ))
+        return [(None, options, 0)]
+
+
 class MemorialForm(forms.ModelForm):
     country = CountryField().formfield(widget=CountrySelectWidget())
     
@@ -207,7 +246,7 @@ class MemorialForm(forms.ModelForm):
         required=False,
         empty_label="No family relation",
         help_text="Select a family member if this person is related to someone you've already added",
-        widget=forms.Select(attrs={'class': 'form-select'})
+        widget=MemorialAutocompleteSelect(attrs={'class': 'form-select'})
     )
     
     relationship_type = forms.ChoiceField(
@@ -233,7 +272,12 @@ class MemorialForm(forms.ModelForm):
         self.fields['image_url'].widget.attrs.update({'type': 'file', 'accept': 'image/jpeg,image/jpg,image/png,image/webp'})
         
         if user and user.is_authenticated:
-            self.fields['related_memorial'].queryset = Memorial.objects.filter(created_by=user, approved=True).order_by('full_name')
+            queryset = Memorial.objects.filter(created_by=user, approved=True).order_by('full_name')
+            if self.instance.pk:
+                # Editing: a memorial can't be its own family member
+                queryset = queryset.exclude(id=self.instance.pk)
+                self.fields['related_memorial'].widget.exclude = self.instance.pk
+            self.fields['related_memorial'].queryset = queryset
         else:
             self.fields['related_memorial'].widget = forms.HiddenInput()
             self.fields['relationship_type'].widget = forms.HiddenInput()
@@ -288,7 +332,7 @@ class SuggestRelationshipForm(forms.Form):
         required=True,
         label="Select Your Memorial",
         help_text="Which of your memorials is related to this person?",
-        widget=forms.Select(attrs={'class': 'form-select'})
+        widget=MemorialAutocompleteSelect(attrs={'class': 'form-select'})
     )
     
     relationship_type = forms.ChoiceField(
@@ -315,6 +359,7 @@ class SuggestRelationshipForm(forms.Form):
             queryset = Memorial.objects.filter(created_by=user, approved=True).order_by('full_name')
             if target_memorial:
                 queryset = queryset.exclude(id=target_memorial.id)
+                self.fields['my_memorial'].widget.exclude = target_memorial.id
             self.fields['my_memorial'].queryset = queryset
     
     def clean(self):
@@ -340,6 +385,7 @@ class UserNotificationSettingsForm(forms.ModelForm):
             'notify_week_before',
             'notify_day_before',
             'notify_on_day',
+            'email_daily_digest',
         ]
         widgets = {
             'enable_anniversary_notifications': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
@@ -349,6 +395,7 @@ class UserNotificationSettingsForm(forms.ModelForm):
             'notify_week_before': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'notify_day_before': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'notify_on_day': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'email_daily_digest': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
         labels = {
             'enable_anniversary_notifications': 'Enable Anniversary Notifications',
@@ -358,14 +405,36 @@ class UserNotificationSettingsForm(forms.ModelForm):
             'notify_week_before': '1 Week Before',
             'notify_day_before': '1 Day Before',
             'notify_on_day': 'On the Day',
+            'email_daily_digest': 'Daily Email Digest',
         }
         help_texts = {
             'enable_anniversary_notifications': 'Receive automatic reminders for memorial anniversaries',
             'notify_week_before': 'Get notified 7 days in advance',
             'notify_day_before': 'Get notified 1 day in advance',
             'notify_on_day': 'Get notified on the anniversary day',
+            'email_daily_digest': "One email a day with the notifications you haven't read yet",
         }
 
+    # Anniversary reminders are a premium feature; the digest is for everyone
+    PREMIUM_FIELDS = (
+        'enable_anniversary_notifications',
+        'notify_death_anniversaries',
+        'notify_birthdays',
+        'notify_milestones',
+        'notify_week_before',
+        'notify_day_before',
+        'notify_on_day',
+    )
+
+    def __init__(self, *args, **kwargs):
+        premium = kwargs.pop('premium', False)
+        super().__init__(*args, **kwargs)
+
+        if not premium:
+            # Disabled fields render read-only and ignore whatever is posted for them
+            for name in self.PREMIUM_FIELDS:
+                self.fields[name].disabled = True
+
 
 class MemorialReminderSettingsForm(forms.ModelForm):
     class Meta:
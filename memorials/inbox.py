@@ -0,0 +1,108 @@
+# ============================================================================
+# inbox.py - Cached per-user counters for the navbar badges
+# ============================================================================
+#
+# Pending relationship suggestions, unread notifications and unreviewed smart
+# matches are counted once and cached per user. The cache key carries a
+# per-user version; writes to the underlying models bump it (O(1), no key
+# scanning), so steady-state page views run no COUNT queries at all.
+#
+# Every invalidation also sends inbox_changed, which memorials.live uses to
+# push the new counts to the user's open pages.
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .caching import bump_version, cache_aside, get_versions, versioned_key
+from .models import FamilyRelationship, Memorial, Notification, SmartMatchSuggestion
+
+# Sent with user_ids=[...] whenever those users' counters are invalidated
+inbox_changed = Signal()
+
+EMPTY_COUNTS = {
+    'pending_suggestions': 0,
+    'unread_notifications': 0,
+    'unreviewed_matches': 0,
+}
+
+
+def _namespace(user_id):
+    return f'inbox:{user_id}'
+
+
+def count_inbox(user):
+    """Run the three COUNT queries behind the navbar badges"""
+    return {
+        'pending_suggestions': FamilyRelationship.objects.filter(
+            status='pending'
+        ).filter(
+            Q(person_a__created_by=user) | Q(person_b__created_by=user)
+        ).count(),
+        'unread_notifications': Notification.objects.filter(user=user, is_read=False).count(),
+        'unreviewed_matches': SmartMatchSuggestion.objects.filter(
+            my_memorial__created_by=user,
+            status='pending'
+        ).count(),
+    }
+
+
+def get_inbox_counts(user):
+    """Cached counts for `user` (all zero for anonymous users)"""
+    if not user.is_authenticated:
+        return dict(EMPTY_COUNTS)
+
+    return cache_aside(
+        versioned_key(_namespace(user.pk), 'counts'), lambda: count_inbox(user),
+        alias='counters', timeout=getattr(settings, 'INBOX_COUNTS_CACHE_TIMEOUT', 600),
+    )
+
+
+def get_inbox_versions(user_ids):
+    """{user_id: version of their counters} in one cache round trip (None if never counted)"""
+    user_ids = list(user_ids)
+    versions = get_versions([_namespace(user_id) for user_id in user_ids])
+    return {user_id: versions[_namespace(user_id)] for user_id in user_ids}
+
+
+def invalidate_inbox(*user_ids):
+    """Bump the version of each user's counters; call after .update()/bulk writes"""
+    user_ids = set(user_ids) - {None}
+    for user_id in user_ids:
+        bump_version(_namespace(user_id))
+    if user_ids:
+        inbox_changed.send(sender=None, user_ids=user_ids)
+
+
+# ----------------------------------------------------------------------------
+# Invalidate on writes
+# ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=FamilyRelationship)
+@receiver(post_delete, sender=FamilyRelationship)
+def relationship_changed(sender, instance, raw=False, **kwargs):
+    """Both memorials' owners see pending suggestions"""
+    if raw:
+        return
+    owners = Memorial.objects.filter(
+        id__in=[instance.person_a_id, instance.person_b_id]
+    ).values_list('created_by_id', flat=True)
+    invalidate_inbox(*owners)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def notification_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_inbox(instance.user_id)
+
+
+@receiver(post_save, sender=SmartMatchSuggestion)
+@receiver(post_delete, sender=SmartMatchSuggestion)
+def smart_match_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    owner = Memorial.objects.filter(id=instance.my_memorial_id).values_list('created_by_id', flat=True).first()
+    invalidate_inbox(owner)
@@ -0,0 +1,248 @@
+# ============================================================================
+# jobs.py - Database-backed background jobs
+# ============================================================================
+#
+# A minimal task queue on the Job table, enough for the app's own background
+# work without a broker. shared_task wraps a function the way Celery's does:
+# calling it runs it inline, .delay()/.apply_async() insert a Job row. The
+# row is written in the caller's transaction, so a job queued by a request
+# that rolls back never runs, and one queued by a request that commits is
+# never lost.
+#
+# Workers (manage.py run_worker) claim due jobs in small batches:
+#   - PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+#     each take different rows without waiting on one another.
+#   - SQLite (no row locks): an UPDATE that stamps the candidates with a
+#     one-off token, guarded by status='queued'; whichever worker's update
+#     lands first owns the row, the others' match nothing.
+# A finished job's row is deleted. A failed one is retried with exponential
+# backoff up to its max_retries, then kept with status 'failed' and the
+# traceback. While a job runs, its worker refreshes locked_at every quarter
+# of JOB_LOCK_TIMEOUT, however long the job takes; a lock older than that
+# means the worker died mid-run (crash, OOM kill), and the job is requeued,
+# or failed once its attempts are used up, so a job that kills its worker
+# can't loop forever.
+
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> Task, filled in as modules defining tasks are imported
+registry = {}
+
+
+class Task:
+    """A function that can also be queued; the subset of celery.Task the app uses"""
+
+    def __init__(self, func, name=None, max_retries=3):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name or f'{func.__module__}.{func.__name__}'
+        self.max_retries = max_retries
+        registry[self.name] = self
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.apply_async(args, kwargs)
+
+    def apply_async(self, args=None, kwargs=None, countdown=None, eta=None):
+        """Queue a run with JSON-serializable arguments, after `countdown` seconds or at `eta`"""
+        return Job.objects.create(
+            task=self.name,
+            args=list(args or ()),
+            kwargs=dict(kwargs or {}),
+            max_retries=self.max_retries,
+            run_at=eta or timezone.now() + timedelta(seconds=countdown or 0),
+        )
+
+
+def shared_task(func=None, *, name=None, max_retries=3):
+    """Drop-in for celery.shared_task: @shared_task or @shared_task(name=..., max_retries=...)"""
+    def decorate(func):
+        return Task(func, name=name, max_retries=max_retries)
+    return decorate(func) if func is not None else decorate
+
+
+# ----------------------------------------------------------------------------
+# Claiming and running
+# ----------------------------------------------------------------------------
+
+def claim_jobs(worker_id, limit=1):
+    """Lock up to `limit` due jobs for `worker_id` and return them"""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('run_at', 'id')
+    # The random suffix keeps tokens unique, so a long worker id (hostname) can just be cut short
+    suffix = uuid.uuid4().hex[:12]
+    id_length = Job._meta.get_field('locked_by').max_length - len(suffix) - 1
+    token = f'{worker_id[:id_length]}:{suffix}'
+    claim = {'status': 'running', 'locked_by': token, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    connection = connections[router.db_for_write(Job)]
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=connection.alias):
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**claim)
+    else:
+        ids = list(due.values_list('id', flat=True)[:limit])
+        Job.objects.filter(id__in=ids, status='queued').update(**claim)
+    return list(Job.objects.filter(id__in=ids, locked_by=token))
+
+
+def run_job(job):
+    """Run a claimed job; True if it succeeded"""
+    task = registry.get(job.task)
+    try:
+        if task is None:
+            raise LookupError(f'No task registered as {job.task!r}')
+        task(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Job %s failed (attempt %d of %d)', job, job.attempts, job.max_retries + 1)
+        release = {'locked_by': '', 'locked_at': None, 'last_error': traceback.format_exc()}
+        if job.attempts <= job.max_retries:
+            delay = settings.JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', run_at=timezone.now() + timedelta(seconds=delay), **release
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(status='failed', **release)
+        return False
+
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def requeue_stale_jobs():
+    """
+    Recover running jobs whose lock is older than JOB_LOCK_TIMEOUT (their
+    worker crashed or was killed): requeued, or failed if that run was their
+    last attempt. Returns the number of jobs recovered.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    release = {'locked_by': '', 'locked_at': None}
+    failed = stale.filter(attempts__gt=F('max_retries')).update(
+        status='failed', last_error='The worker running this job died (crash, kill or timeout)', **release
+    )
+    return failed + stale.update(status='queued', **release)
+
+
+class Worker:
+    """`concurrency` threads claiming and running jobs until stop() (or, in burst mode, until the queue is empty)"""
+
+    def __init__(self, concurrency=1, poll_interval=None, burst=False):
+        self.concurrency = concurrency
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.burst = burst
+        self.succeeded = 0
+        self.failed = 0
+        self._stopping = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._running = set()  # ids of the jobs in hand, for the heartbeat
+        self._requeued_at = float('-inf')
+
+    def stop(self):
+        """Finish the jobs in hand, then return from run()"""
+        self._stopping.set()
+
+    def run(self):
+        autodiscover_modules('tasks')
+        threads = [
+            threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+            for number in range(self.concurrency)
+        ]
+        heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        heartbeat.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Short joins keep the main thread responsive to signals
+            while thread.is_alive():
+                thread.join(0.5)
+        self._finished.set()
+        heartbeat.join()
+
+    def _heartbeat(self):
+        """Refresh locked_at of the jobs in hand, so requeue_stale_jobs() leaves long runs alone"""
+        try:
+            while not self._finished.wait(settings.JOB_LOCK_TIMEOUT / 4):
+                with self._lock:
+                    job_ids = list(self._running)
+                if not job_ids:
+                    continue
+                try:
+                    Job.objects.filter(id__in=job_ids, status='running').update(locked_at=timezone.now())
+                except DatabaseError:
+                    logger.warning('Job heartbeat database error', exc_info=True)
+                finally:
+                    close_old_connections()
+        finally:
+            connections.close_all()
+
+    def _requeue_due(self):
+        """True for one idle thread per minute, which then looks for stale jobs"""
+        with self._lock:
+            if time.monotonic() - self._requeued_at < 60:
+                return False
+            self._requeued_at = time.monotonic()
+            return True
+
+    def _work(self):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if self._step(worker_id):
+                        continue
+                    if self.burst:
+                        return
+                except DatabaseError:
+                    # e.g. SQLite busy under concurrent writers; back off and try again
+                    logger.warning('Job worker database error', exc_info=True)
+                finally:
+                    close_old_connections()
+                self._stopping.wait(self.poll_interval)
+        finally:
+            connections.close_all()
+
+    def _step(self, worker_id):
+        """Claim and run the next due job; False when there was none"""
+        jobs = claim_jobs(worker_id)
+        if not jobs:
+            return self._requeue_due() and requeue_stale_jobs() > 0
+
+        for job in jobs:
+            with self._lock:
+                self._running.add(job.pk)
+            try:
+                succeeded = run_job(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job.pk)
+            with self._lock:
+                if succeeded:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+        return True
@@ -0,0 +1,263 @@
+# ============================================================================
+# live.py - Live navbar badge counts over Server-Sent Events
+# ============================================================================
+#
+# Each logged-in page opens one EventSource to inbox_stream; the stream sends
+# the user's inbox counts (memorials.inbox) on connect and again whenever they
+# change. Under ASGI an idle stream is just a suspended coroutine waiting on
+# an asyncio.Event, so one worker holds thousands of them.
+#
+# Streams are woken three ways, fastest first:
+#   1. In-process pub/sub: invalidate_inbox() sends inbox_changed, and the
+#      broker below wakes that user's streams in this process (after commit).
+#   2. Version polling: writes made by other processes (other workers, cron
+#      commands) bump the same inbox versions in the shared 'counters' cache.
+#      One poller per process reads the versions of every connected user in a
+#      single get_many() every INBOX_STREAM_POLL_INTERVAL seconds.
+#   3. Recount: every INBOX_STREAM_REFRESH_INTERVAL seconds a stream re-reads
+#      its counts through get_inbox_counts(), which goes to the database once
+#      the cached counts expire. This covers caches that aren't shared.
+#
+# Under ASGI the stream bypasses Django's handler (see with_inbox_stream in
+# asgi.py): Django gives every request its own thread for sync work, which
+# it keeps until the response ends, so thousands of streams would pin
+# thousands of threads and database connections. serve_inbox_stream does
+# its few sync calls (session, counts) on the shared executor instead. The
+# regular view (views.inbox_stream) serves the stream under other ASGI setups;
+# under WSGI (runserver, wsgi.py) it answers 204 and the badges stay static,
+# since Django's WSGI handler drains an async stream before sending it.
+
+import asyncio
+import io
+import json
+import threading
+from collections import defaultdict
+from contextlib import aclosing
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import translation
+
+from .inbox import get_inbox_counts, get_inbox_versions, inbox_changed
+
+
+def _on_executor(func):
+    """
+    sync_to_async() on the shared thread pool rather than a per-request
+    thread; the pool's threads outlive requests, so drop their stale
+    database connections after every call.
+    """
+    def call(*args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+class Subscription:
+    """One open stream: an Event on the stream's event loop, settable from any thread"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # loop already closed; the stream is gone
+
+    async def wait(self, timeout):
+        """True if notified within `timeout` seconds, False on timeout"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.event.clear()
+        return True
+
+
+class InboxBroker:
+    """Per-process registry of open streams by user id, plus the version poller"""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._versions = {}
+        self._poller = None
+        self._lock = threading.Lock()  # publish() runs on request threads
+
+    def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(loop)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        if self._poller is None or self._poller.done() or self._poller.get_loop() is not loop:
+            self._poller = loop.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[user_id]
+
+    def publish(self, *user_ids):
+        with self._lock:
+            subscriptions = [s for user_id in user_ids for s in self._subscriptions.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def connected_users(self):
+        with self._lock:
+            return list(self._subscriptions)
+
+    async def _poll(self):
+        interval = getattr(settings, 'INBOX_STREAM_POLL_INTERVAL', 5)
+        while True:
+            await asyncio.sleep(interval)
+            user_ids = self.connected_users()
+            if not user_ids:
+                self._versions.clear()
+                return
+
+            # Users seen for the first time are woken too: their stream read its
+            # counts before this baseline, so a change in between would be lost
+            versions = await _on_executor(get_inbox_versions)(user_ids)
+            changed = [
+                user_id for user_id, version in versions.items()
+                if user_id not in self._versions or self._versions[user_id] != version
+            ]
+            self._versions = versions
+            if changed:
+                self.publish(*changed)
+
+
+broker = InboxBroker()
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def inbox_events(user):
+    """
+    The event stream for `user`: a 'counts' event on connect and on every
+    change, a comment line as keepalive. Ends after INBOX_STREAM_MAX_AGE
+    seconds; EventSource reconnects by itself.
+    """
+    keepalive = getattr(settings, 'INBOX_STREAM_KEEPALIVE', 25)
+    refresh_interval = getattr(settings, 'INBOX_STREAM_REFRESH_INTERVAL', 300)
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + getattr(settings, 'INBOX_STREAM_MAX_AGE', 1800)
+    read_counts = _on_executor(get_inbox_counts)
+
+    subscription = broker.subscribe(user.pk)
+    try:
+        yield 'retry: 5000\n\n'
+        counts = await read_counts(user)
+        refreshed_at = loop.time()
+        yield _event('counts', counts)
+
+        while loop.time() < ends_at:
+            notified = await subscription.wait(min(keepalive, max(ends_at - loop.time(), 0)))
+            if not notified and loop.time() - refreshed_at < refresh_interval:
+                yield ': keepalive\n\n'
+                continue
+
+            current = await read_counts(user)
+            refreshed_at = loop.time()
+            if current != counts:
+                counts = current
+                yield _event('counts', counts)
+            elif not notified:
+                yield ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(user.pk, subscription)
+
+
+# ----------------------------------------------------------------------------
+# ASGI endpoint
+# ----------------------------------------------------------------------------
+
+def _authenticate(request):
+    """The session's user (AnonymousUser if none), as SessionMiddleware + AuthenticationMiddleware would"""
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    return get_user(request)
+
+
+async def serve_inbox_stream(scope, receive, send):
+    """ASGI app for the inbox stream; stops as soon as the client disconnects"""
+    user = await _on_executor(_authenticate)(ASGIRequest(scope, io.BytesIO()))
+    if not user.is_authenticated:
+        # 204 tells EventSource to stop reconnecting
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    async def stream():
+        async with aclosing(inbox_events(user)) as events:
+            async for chunk in events:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = {asyncio.ensure_future(stream()), asyncio.ensure_future(disconnect())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        task.result()
+
+
+def inbox_stream_paths():
+    """The stream's URL in every language; i18n_patterns prefixes all but the default one"""
+    paths = set()
+    for language, _ in settings.LANGUAGES:
+        with translation.override(language):
+            paths.add(reverse('inbox_stream'))
+    return frozenset(paths)
+
+
+def with_inbox_stream(django_application):
+    """Wrap Django's ASGI application so the inbox stream is served by serve_inbox_stream"""
+    paths = None
+
+    async def application(scope, receive, send):
+        nonlocal paths
+        if scope['type'] == 'http':
+            paths = paths or inbox_stream_paths()
+            if scope['path'] in paths:
+                return await serve_inbox_stream(scope, receive, send)
+        return await django_application(scope, receive, send)
+
+    return application
+
+
+@receiver(inbox_changed)
+def publish_inbox_change(sender, user_ids, **kwargs):
+    """Wake the users' streams once the change is visible to other connections"""
+    transaction.on_commit(lambda: broker.publish(*user_ids))
@@ -0,0 +1,31 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from memorials.anniversaries import CALENDAR_HORIZON_DAYS, build_calendar
+from memorials.models import ScheduledNotification
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized anniversary calendar (unsent reminders for the next year)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Memorials planned per batch')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        end = today + timedelta(days=CALENDAR_HORIZON_DAYS)
+        self.stdout.write(f'Building anniversary calendar for {today} to {end}...')
+
+        started = time.monotonic()
+        done = 0
+        for done in build_calendar(today, batch_size=options['batch_size']):
+            self.stdout.write(f'Planned {done} memorials...')
+        seconds = time.monotonic() - started
+
+        rows = ScheduledNotification.objects.filter(is_sent=False, scheduled_date__gte=today).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully scheduled {rows} reminders for {done} memorials in {seconds:.2f}s'
+            f" ({done / seconds if seconds else 0:,.0f} memorials/s)"
+        ))
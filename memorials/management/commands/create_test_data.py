@@ -53,6 +53,7 @@ class Command(BaseCommand):
                 approved=random.choice([True, True, True, False]),  # 75% approved
                 created_at=fake.date_time_between(start_date='-2y', end_date='now', tzinfo=timezone.get_current_timezone())
             )
+            memorial.populate_derived_fields()  # bulk_create skips save()
             memorials.append(memorial)
             
             # Batch create every 1000 records
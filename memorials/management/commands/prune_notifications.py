@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from memorials.retention import archive_notifications
+
+
+class Command(BaseCommand):
+    help = 'Move read notifications past the retention window to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS, help='Keep read notifications this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_PRUNE_BATCH_SIZE, help='Rows moved per transaction')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        moved = 0
+        for count in archive_notifications(options['days'], options['batch_size'], options['pause']):
+            moved += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {moved} notifications archived')
+        seconds = time.monotonic() - started
+
+        rate = f'{moved / seconds:,.0f}' if seconds else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} read notifications older than {options["days"]} days in {seconds:.2f}s ({rate} rows/s)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from memorials.models import Memorial
+from memorials.search import rebuild_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for memorials'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Memorials indexed per statement')
+
+    def handle(self, *args, **options):
+        backend = search_backend()
+        if backend is None:
+            self.stdout.write(self.style.WARNING(
+                'No full-text index on this database (run migrate, or SQLite lacks FTS5). Nothing to rebuild.'
+            ))
+            return
+
+        self.stdout.write(f'Rebuilding {backend} search index...')
+
+        total = 0
+        for total in rebuild_index(Memorial.objects.order_by('id'), batch_size=options['batch_size']):
+            self.stdout.write(f'Indexed {total} memorials...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully indexed {total} memorials'))
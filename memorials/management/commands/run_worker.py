@@ -0,0 +1,32 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from memorials.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (memorials.jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker threads')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds an idle thread waits before polling again')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['concurrency'], options['poll_interval'], burst=options['burst'])
+
+        # Finish the jobs in hand on SIGTERM/Ctrl-C instead of dying mid-job
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: worker.stop())
+
+        self.stdout.write(f"Worker running with {options['concurrency']} thread(s)")
+        started = time.monotonic()
+        worker.run()
+        seconds = time.monotonic() - started
+
+        done = worker.succeeded + worker.failed
+        rate = f'{done / seconds:,.0f}' if seconds else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {done} jobs ({worker.failed} failed) in {seconds:.2f}s ({rate} jobs/s)'
+        ))
@@ -1,120 +1,43 @@
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import date, timedelta
-from memorials.models import Memorial, Notification, UserProfile
-from django.contrib.auth.models import User
+from memorials.anniversaries import build_calendar, calendar_needs_build, extend_calendar, send_scheduled_notifications
+
 
 class Command(BaseCommand):
     help = 'Send anniversary notifications to premium users'
-    
-    def handle(self, *args, **kwargs):
-        today = date.today()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Notifications inserted per statement')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
         self.stdout.write(f"Running anniversary check for {today}")
-        
-        notifications_sent = 0
-        
-        # Check next 7 days for anniversaries
-        for days_ahead in [1, 7]:  # 1 day before and 7 days before
-            check_date = today + timedelta(days=days_ahead)
-            
-            # Find death anniversaries
-            death_anniversaries = Memorial.objects.filter(
-                dod__month=check_date.month,
-                dod__day=check_date.day
-            ).select_related('created_by')
-            
-            for memorial in death_anniversaries:
-                years = check_date.year - memorial.dod.year
-                
-                # Only notify creator if they're premium
-                try:
-                    profile = memorial.created_by.userprofile
-                    if not profile.is_premium or not profile.enable_anniversary_notifications:
-                        continue
-                    
-                    if not profile.notify_death_anniversaries:
-                        continue
-                    
-                    # Check if we should notify based on timing preference
-                    if days_ahead == 7 and not profile.notify_week_before:
-                        continue
-                    if days_ahead == 1 and not profile.notify_day_before:
-                        continue
-                    
-                    # Check if notification already exists
-                    existing = Notification.objects.filter(
-                        user=memorial.created_by,
-                        notification_type='death_anniversary',
-                        related_memorial=memorial,
-                        created_at__date=today
-                    ).exists()
-                    
-                    if existing:
-                        continue
-                    
-                    # Create notification
-                    timing = "tomorrow" if days_ahead == 1 else "in one week"
-                    
-                    Notification.objects.create(
-                        user=memorial.created_by,
-                        notification_type='death_anniversary',
-                        title=f"Upcoming Anniversary: {memorial.full_name}",
-                        message=f"The {years}-year anniversary of {memorial.full_name}'s passing is {timing} ({check_date.strftime('%B %d, %Y')}).",
-                        related_memorial=memorial,
-                        action_url=f'/memorial/{memorial.id}/family-tree/',
-                    )
-                    
-                    notifications_sent += 1
-                    
-                except UserProfile.DoesNotExist:
-                    continue
-            
-            # Find birthdays
-            birthdays = Memorial.objects.filter(
-                dob__month=check_date.month,
-                dob__day=check_date.day
-            ).select_related('created_by')
-            
-            for memorial in birthdays:
-                age = check_date.year - memorial.dob.year
-                
-                try:
-                    profile = memorial.created_by.userprofile
-                    if not profile.is_premium or not profile.enable_anniversary_notifications:
-                        continue
-                    
-                    if not profile.notify_birthdays:
-                        continue
-                    
-                    if days_ahead == 7 and not profile.notify_week_before:
-                        continue
-                    if days_ahead == 1 and not profile.notify_day_before:
-                        continue
-                    
-                    existing = Notification.objects.filter(
-                        user=memorial.created_by,
-                        notification_type='birthday_anniversary',
-                        related_memorial=memorial,
-                        created_at__date=today
-                    ).exists()
-                    
-                    if existing:
-                        continue
-                    
-                    timing = "tomorrow" if days_ahead == 1 else "in one week"
-                    
-                    Notification.objects.create(
-                        user=memorial.created_by,
-                        notification_type='birthday_anniversary',
-                        title=f"Birthday Coming: {memorial.full_name}",
-                        message=f"{memorial.full_name} would have been {age} years old {timing} ({check_date.strftime('%B %d, %Y')}).",
-                        related_memorial=memorial,
-                        action_url=f'/memorial/{memorial.id}/family-tree/',
-                    )
-                    
-                    notifications_sent += 1
-                    
-                except UserProfile.DoesNotExist:
-                    continue
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully sent {notifications_sent} anniversary notifications'))
\ No newline at end of file
+
+        started = time.monotonic()
+        if calendar_needs_build():
+            # First run since the calendar was introduced: build the whole year
+            built = 0
+            for built in build_calendar(today, batch_size=options['batch_size']):
+                pass
+            self.stdout.write(f'Built the calendar for {built} memorials in {time.monotonic() - started:.2f}s')
+        else:
+            # Slide the calendar forward: dates entering the one-year horizon
+            extended = extend_calendar(today)
+            self.stdout.write(f'Extended the calendar for {extended} memorials in {time.monotonic() - started:.2f}s')
+
+        started = time.monotonic()
+        sent = 0
+        for count in send_scheduled_notifications(today, batch_size=options['batch_size']):
+            sent += count
+        seconds = time.monotonic() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully sent {sent} anniversary notifications in {seconds:.2f}s'
+            f" ({_rate(sent, seconds)} rows/s)"
+        ))
+
+
+def _rate(rows, seconds):
+    return f'{rows / seconds:,.0f}' if seconds else '-'
@@ -0,0 +1,27 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from memorials.digest import send_daily_digests
+
+
+class Command(BaseCommand):
+    help = "Email each user a digest of the day's unread notifications"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='Day to digest, YYYY-MM-DD (default: yesterday)')
+        parser.add_argument('--batch-size', type=int, default=settings.DIGEST_BATCH_SIZE, help='Messages per send_messages() call')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        sent = 0
+        for count in send_daily_digests(options['date'], batch_size=options['batch_size']):
+            sent += count
+            self.stdout.write(f'  {sent} digests sent')
+        seconds = time.monotonic() - started
+
+        rate = f'{sent / seconds:,.0f}' if seconds else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully sent {sent} daily digests in {seconds:.2f}s ({rate} msgs/s)'
+        ))
@@ -0,0 +1,35 @@
+# memorials/middleware.py
+
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LazyContextReportMiddleware:
+    """
+    Debug aid: report which lazy context values (see context_processors.lazy_context)
+    the templates of a request actually evaluated, and which were skipped.
+    On when DEBUG is (or LAZY_CONTEXT_REPORT is set); logs the report and adds it
+    to the response as X-Lazy-Context-Evaluated / X-Lazy-Context-Skipped headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'LAZY_CONTEXT_REPORT', settings.DEBUG)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        registry = request.__dict__.get('_lazy_context_keys')
+        if self.enabled and registry:
+            evaluated = sorted(key for key, used in registry.items() if used)
+            skipped = sorted(key for key, used in registry.items() if not used)
+            logger.info(
+                'Lazy context for %s %s: evaluated %s, skipped %s',
+                request.method, request.path, evaluated or '-', skipped or '-',
+            )
+            response['X-Lazy-Context-Evaluated'] = ', '.join(evaluated)
+            response['X-Lazy-Context-Skipped'] = ', '.join(skipped)
+        return response
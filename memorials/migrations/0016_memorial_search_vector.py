@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:48
+
+import django.contrib.postgres.search
+from django.db import migrations
+from django_countries import countries
+
+
+FTS_TABLE = 'memorials_memorial_fts'
+BATCH_SIZE = 1000
+
+# The search vector as memorials.search built it when this migration was written
+POSTGRES_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(v.full_name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(v.country_name, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(v.story, '')), 'C')"
+)
+
+
+def _write_rows(cursor, vendor, rows):
+    if vendor == 'postgresql':
+        values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+        cursor.execute(
+            f"UPDATE memorials_memorial AS m SET search_vector = {POSTGRES_VECTOR_SQL} "
+            f"FROM (VALUES {values}) AS v(id, full_name, country_name, story) "
+            f"WHERE m.id = v.id",
+            [value for row in rows for value in row],
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, full_name, country, story) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index on PostgreSQL, FTS5 shadow table on SQLite, then populate it"""
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS memorials_memorial_search_gin "
+            "ON memorials_memorial USING gin (search_vector)"
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "full_name, country, story, tokenize='unicode61 remove_diacritics 2')"
+            )
+        except Exception:
+            return  # SQLite built without FTS5: search falls back to icontains
+        schema_editor.execute(f"DELETE FROM {FTS_TABLE}")
+    else:
+        return
+
+    Memorial = apps.get_model('memorials', 'Memorial')
+    memorials = Memorial.objects.using(connection.alias).values_list('id', 'full_name', 'country', 'story')
+    with connection.cursor() as cursor:
+        batch = []
+        for memorial_id, full_name, country, story in memorials.iterator(chunk_size=BATCH_SIZE):
+            batch.append((memorial_id, full_name, countries.name(country) if country else '', story))
+            if len(batch) >= BATCH_SIZE:
+                _write_rows(cursor, connection.vendor, batch)
+                batch = []
+        if batch:
+            _write_rows(cursor, connection.vendor, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS memorials_memorial_search_gin")
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0015_alter_memorialphoto_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0016_memorial_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemorialSearchEntry',
+            fields=[
+                ('memorial', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='memorials.memorial')),
+                ('full_name', models.TextField()),
+                ('country', models.TextField()),
+                ('story', models.TextField()),
+            ],
+            options={
+                'db_table': 'memorials_memorial_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import ExtractYear
+
+
+def backfill_years(apps, schema_editor):
+    Memorial = apps.get_model('memorials', 'Memorial')
+    Memorial.objects.using(schema_editor.connection.alias).update(
+        birth_year=ExtractYear('dob'),
+        death_year=ExtractYear('dod'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0017_memorialsearchentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='birth_year',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='memorial',
+            name='death_year',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_years, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(fields=['approved', 'birth_year'], name='memorials_m_approve_0c1247_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(fields=['approved', 'death_year'], name='memorials_m_approve_a0ba71_idx'),
+        ),
+    ]
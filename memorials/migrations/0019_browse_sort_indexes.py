@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0018_memorial_birth_year_death_year'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='memorial',
+            name='memorials_m_approve_a0322f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['-created_at', '-id'], name='memorial_browse_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['full_name', 'id'], name='memorial_browse_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['dob', 'id'], name='memorial_browse_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['dod', 'id'], name='memorial_browse_dod_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:59
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_name(value):
+    """memorials.models.normalize_name as of this migration"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def backfill_search_names(apps, schema_editor):
+    Memorial = apps.get_model('memorials', 'Memorial')
+    memorials = Memorial.objects.using(schema_editor.connection.alias).only('id', 'full_name')
+    batch = []
+    for memorial in memorials.iterator(chunk_size=1000):
+        memorial.search_name = normalize_name(memorial.full_name)
+        batch.append(memorial)
+        if len(batch) >= 1000:
+            Memorial.objects.using(schema_editor.connection.alias).bulk_update(batch, ['search_name'])
+            batch = []
+    if batch:
+        Memorial.objects.using(schema_editor.connection.alias).bulk_update(batch, ['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0019_browse_sort_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['search_name', 'id'], name='memorial_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['created_by', 'search_name', 'id'], name='memorial_owner_name_prefix_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_photo_summary(apps, schema_editor):
+    Memorial = apps.get_model('memorials', 'Memorial')
+    MemorialPhoto = apps.get_model('memorials', 'MemorialPhoto')
+    alias = schema_editor.connection.alias
+    photos = MemorialPhoto.objects.filter(memorial=OuterRef('pk'))
+    Memorial.objects.using(alias).filter(
+        pk__in=MemorialPhoto.objects.using(alias).values('memorial')
+    ).update(
+        primary_photo=Subquery(photos.order_by('-is_primary', 'order', '-uploaded_at').values('pk')[:1]),
+        photo_count=Coalesce(
+            Subquery(
+                photos.order_by().values('memorial').annotate(total=Count('id')).values('total'),
+                output_field=models.IntegerField(),
+            ),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0020_memorial_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='photo_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='memorial',
+            name='primary_photo',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='memorials.memorialphoto'),
+        ),
+        migrations.RunPython(backfill_photo_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0021_memorial_photo_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
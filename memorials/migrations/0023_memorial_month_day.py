@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import ExtractDay, ExtractMonth
+
+
+def backfill_month_days(apps, schema_editor):
+    Memorial = apps.get_model('memorials', 'Memorial')
+    Memorial.objects.using(schema_editor.connection.alias).update(
+        dob_md=ExtractMonth('dob') * 100 + ExtractDay('dob'),
+        dod_md=ExtractMonth('dod') * 100 + ExtractDay('dod'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0022_memorial_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorial',
+            name='dob_md',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='memorial',
+            name='dod_md',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_month_days, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(fields=['dob_md'], name='memorial_dob_md_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='memorial',
+            index=models.Index(fields=['dod_md'], name='memorial_dod_md_idx'),
+        ),
+    ]
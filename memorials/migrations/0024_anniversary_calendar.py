@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0023_memorial_month_day'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedulednotification',
+            name='days_before',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('relationship_suggested', 'Relationship Suggested'), ('relationship_approved', 'Relationship Approved'), ('relationship_rejected', 'Relationship Rejected'), ('new_family_member', 'New Family Member'), ('death_anniversary', 'Death Anniversary'), ('birthday_anniversary', 'Birthday Anniversary'), ('milestone_anniversary', 'Milestone Anniversary'), ('custom_reminder', 'Custom Reminder')], max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='schedulednotification',
+            index=models.Index(condition=models.Q(('is_sent', False)), fields=['scheduled_date', 'id'], name='scheduled_unsent_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='schedulednotification',
+            constraint=models.UniqueConstraint(fields=('memorial', 'user', 'notification_type', 'scheduled_date', 'days_before'), name='unique_scheduled_notification'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-19 07:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0026_daily_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('relationship_suggested', 'Relationship Suggested'), ('relationship_approved', 'Relationship Approved'), ('relationship_rejected', 'Relationship Rejected'), ('new_family_member', 'New Family Member'), ('death_anniversary', 'Death Anniversary'), ('birthday_anniversary', 'Birthday Anniversary'), ('milestone_anniversary', 'Milestone Anniversary'), ('custom_reminder', 'Custom Reminder')], max_length=50)),
+                ('title', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='memorials_n_user_id_a27e66_idx',
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', True)), fields=['created_at', 'id'], name='notification_read_idx'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='related_memorial',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='memorials.memorial'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=models.Index(fields=['user', '-created_at'], name='memorials_n_user_id_26ce13_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memorials', '0029_notification_unemailed_unread'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
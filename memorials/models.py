@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.urls import reverse
@@ -6,10 +8,24 @@ from django.utils import timezone
 from django.conf import settings
 from cloudinary.models import CloudinaryField
 from django_countries.fields import CountryField
+from django.contrib.postgres.search import SearchVectorField
 import uuid
+import unicodedata
 from datetime import timedelta
 
 
+def month_day(value):
+    """MMDD key of a date, e.g. date(1950, 2, 29) -> 229; None for None"""
+    return value.month * 100 + value.day if value else None
+
+
+def normalize_name(value):
+    """Casefold, strip accents and collapse whitespace: 'José  Núñez' -> 'jose nunez'"""
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
 
 
 class MemorialPhoto(models.Model):
@@ -82,14 +98,28 @@ class MemorialPhoto(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         
-        # If this is set as primary, remove primary status from other photos
-        if self.is_primary:
-            MemorialPhoto.objects.filter(
-                memorial=self.memorial,
-                is_primary=True
-            ).exclude(pk=self.pk).update(is_primary=False)
-        
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # If this is set as primary, remove primary status from other photos
+            if self.is_primary:
+                MemorialPhoto.objects.filter(
+                    memorial=self.memorial,
+                    is_primary=True
+                ).exclude(pk=self.pk).update(is_primary=False)
+            
+            super().save(*args, **kwargs)
+            
+            # Caption/alt text edits don't change the memorial's primary photo or count
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None or {'is_primary', 'order', 'memorial'} & set(update_fields):
+                self.memorial.refresh_photo_summary()
+            else:
+                Memorial.objects.filter(pk=self.memorial_id).touch()
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.memorial.refresh_photo_summary()
+        return result
     
     def get_absolute_url(self):
         return self.photo.url
@@ -197,6 +227,35 @@ class PaymentTransaction(models.Model):
     def __str__(self):
         return f"${self.amount} - {self.user.username} - {self.status}"
 
+class MemorialQuerySet(models.QuerySet):
+    def with_photo_summary(self):
+        """Join the denormalized primary photo, for list pages that show a thumbnail per card"""
+        return self.select_related('primary_photo')
+
+    def touch(self):
+        """Mark the memorials as modified now, e.g. after a change to their photos or relationships"""
+        return self.update(updated_at=timezone.now())
+
+    def refresh_photo_summary(self):
+        """
+        Recompute primary_photo (the photo marked primary, else the first in gallery
+        order) and photo_count from the photos table, in one UPDATE that also
+        touches updated_at.
+        """
+        photos = MemorialPhoto.objects.filter(memorial=OuterRef('pk'))
+        return self.update(
+            updated_at=timezone.now(),
+            primary_photo=Subquery(photos.order_by('-is_primary', 'order', '-uploaded_at').values('pk')[:1]),
+            photo_count=Coalesce(
+                Subquery(
+                    photos.order_by().values('memorial').annotate(total=Count('id')).values('total'),
+                    output_field=models.IntegerField(),
+                ),
+                0,
+            ),
+        )
+
+
 class Memorial(models.Model):
     full_name = models.CharField(max_length=200, blank=False)
     dob = models.DateField("Date of Birth")
@@ -208,6 +267,38 @@ class Memorial(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memorials')  # New field
 
+    # Last change to the memorial or to what its pages show (photos, relationships,
+    # owner's subscription); drives ETag/Last-Modified, see memorials.conditional
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Full-text index (PostgreSQL only, maintained by memorials.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Copies of dob/dod years so year filters can use an index (set in save())
+    birth_year = models.SmallIntegerField(null=True, blank=True, editable=False)
+    death_year = models.SmallIntegerField(null=True, blank=True, editable=False)
+
+    # month_day(dob)/month_day(dod), so the anniversary job's daily lookup is an
+    # index equality probe (memorials.anniversaries)
+    dob_md = models.SmallIntegerField(null=True, blank=True, editable=False)
+    dod_md = models.SmallIntegerField(null=True, blank=True, editable=False)
+
+    # normalize_name(full_name), for indexed prefix lookups by the name autocomplete
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False)
+
+    # Denormalized from MemorialPhoto, kept in sync by MemorialPhoto.save()/delete()
+    primary_photo = models.ForeignKey(
+        'MemorialPhoto',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    photo_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = MemorialQuerySet.as_manager()
+
     # share_token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     # is_shareable = models.BooleanField(default=True, help_text="Allow this memorial to be shared publicly")
     # share_count = models.PositiveIntegerField(default=0, help_text="Number of times this memorial has been shared")
@@ -245,7 +336,12 @@ class Memorial(models.Model):
 
     def get_photo_count(self):
         """Get current number of photos for this memorial"""
-        return self.photos.count()
+        return self.photo_count
+
+    def refresh_photo_summary(self):
+        """Recompute primary_photo/photo_count after the photos changed, and reload them"""
+        Memorial.objects.filter(pk=self.pk).refresh_photo_summary()
+        self.refresh_from_db(fields=['primary_photo', 'photo_count', 'updated_at'])
 
     def can_add_photo(self):
         """Check if user can add more photos"""
@@ -267,12 +363,33 @@ class Memorial(models.Model):
                 raise ValidationError({
                     'dod': 'Date of death cannot be before date of birth.'
                 })
+    def populate_derived_fields(self):
+        """Fill the columns derived from full_name/dob/dod (call this before bulk_create too)"""
+        self.search_name = normalize_name(self.full_name)
+        self.birth_year = self.dob.year if self.dob else None
+        self.death_year = self.dod.year if self.dod else None
+        self.dob_md = month_day(self.dob)
+        self.dod_md = month_day(self.dod)
+
     def save(self, *args, **kwargs):
         """Clean whitespace and call clean before saving"""
         # Strip whitespace from full_name
         if self.full_name:
             self.full_name = self.full_name.strip()
         self.full_clean()
+        self.populate_derived_fields()
+
+        # Partial saves of the source fields must also write the derived columns,
+        # and every save bumps updated_at
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'updated_at'}
+            if 'full_name' in update_fields:
+                update_fields.add('search_name')
+            if {'dob', 'dod'} & update_fields:
+                update_fields |= {'birth_year', 'death_year', 'dob_md', 'dod_md'}
+            kwargs['update_fields'] = update_fields
+
         super().save(*args, **kwargs)
 
     class Meta:
@@ -282,7 +399,20 @@ class Memorial(models.Model):
             models.Index(fields=['created_at']),
             models.Index(fields=['full_name']),
             models.Index(fields=['country']),
-            models.Index(fields=['approved', '-created_at']),  # Compound index
+            models.Index(fields=['approved', 'birth_year']),
+            models.Index(fields=['approved', 'death_year']),
+            models.Index(fields=['dob_md'], name='memorial_dob_md_idx'),
+            models.Index(fields=['dod_md'], name='memorial_dod_md_idx'),
+            # One per browse sort mode (memorials.browse.SORT_MODES), id as tie-breaker.
+            # Partial on approved: SQLite compiles approved=True to a bare
+            # "WHERE approved", which only a matching index condition can use.
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(approved=True), name='memorial_browse_created_idx'),
+            models.Index(fields=['full_name', 'id'], condition=models.Q(approved=True), name='memorial_browse_name_idx'),
+            models.Index(fields=['dob', 'id'], condition=models.Q(approved=True), name='memorial_browse_dob_idx'),
+            models.Index(fields=['dod', 'id'], condition=models.Q(approved=True), name='memorial_browse_dod_idx'),
+            # Name autocomplete: public prefix search, and within one user's memorials
+            models.Index(fields=['search_name', 'id'], condition=models.Q(approved=True), name='memorial_name_prefix_idx'),
+            models.Index(fields=['created_by', 'search_name', 'id'], condition=models.Q(approved=True), name='memorial_owner_name_prefix_idx'),
         ]
 
     def __str__(self):
@@ -292,11 +422,29 @@ class Memorial(models.Model):
     
     def get_primary_photo(self):
         '''Get the primary photo, or first uploaded if none marked as primary'''
-        primary = self.photos.filter(is_primary=True).first()
-        if primary:
-            return primary
-        return self.photos.first()
+        return self.primary_photo
     
+class MemorialSearchEntry(models.Model):
+    """
+    Row of the SQLite FTS5 shadow table created by migration 0016 (see memorials.search).
+    Unmanaged: it only exists on SQLite, and rowid is the memorial id.
+    """
+    memorial = models.OneToOneField(
+        Memorial,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='search_entry'
+    )
+    full_name = models.TextField()
+    country = models.TextField()
+    story = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'memorials_memorial_fts'
+
 RELATIONSHIP_CHOICES = [
     ('parent', 'Parent'),
     ('child', 'Child'),
@@ -400,6 +548,9 @@ class UserProfile(models.Model):
     notify_day_before = models.BooleanField(default=True)
     notify_on_day = models.BooleanField(default=True)
     
+    # Email: one digest of the day's unread notifications (memorials.digest); opt-in
+    email_daily_digest = models.BooleanField(default=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -434,14 +585,28 @@ class MemorialReminderSettings(models.Model):
     custom_reminder_label = models.CharField(max_length=100, blank=True)
 
 class ScheduledNotification(models.Model):
+    """One reminder in the materialized anniversary calendar (memorials.anniversaries)"""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     memorial = models.ForeignKey('Memorial', on_delete=models.CASCADE)
-    notification_type = models.CharField(max_length=50)  # 'death_anniversary', 'birthday', etc.
-    scheduled_date = models.DateField()
+    notification_type = models.CharField(max_length=50)  # 'death_anniversary', 'birthday_anniversary', etc.
+    scheduled_date = models.DateField()  # when to send; the event is days_before later
+    days_before = models.SmallIntegerField(default=0)  # 0 (on the day), 1 or 7
     year_count = models.IntegerField()  # e.g., "5th anniversary"
     is_sent = models.BooleanField(default=False)
     sent_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # The daily job's "today's unsent rows"
+            models.Index(fields=['scheduled_date', 'id'], condition=models.Q(is_sent=False), name='scheduled_unsent_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['memorial', 'user', 'notification_type', 'scheduled_date', 'days_before'],
+                name='unique_scheduled_notification'
+            )
+        ]
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
         ('relationship_suggested', 'Relationship Suggested'),
@@ -450,6 +615,8 @@ class Notification(models.Model):
         ('new_family_member', 'New Family Member'),
         ('death_anniversary', 'Death Anniversary'),  # ADD
         ('birthday_anniversary', 'Birthday Anniversary'),  # ADD        
+        ('milestone_anniversary', 'Milestone Anniversary'),
+        ('custom_reminder', 'Custom Reminder'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -470,11 +637,34 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
     
+    # Deterministic identity of the event notified about (memorials.notifications.dedupe_key);
+    # unique per user, so re-running a producer can't notify twice
+    dedupe_key = models.CharField(max_length=150, null=True, blank=True, editable=False)
+    
+    # When the notification went out in a daily digest email (memorials.digest)
+    emailed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user', 'is_read']),
+            # The inbox's unread/read lists, paged newest first by (created_at, id) cursors
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_inbox_idx'),
             models.Index(fields=['-created_at']),
+            # Oldest read notifications first, for memorials.retention
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_read=True), name='notification_read_idx'),
+            # The digest's "this day's unread notifications not emailed yet"; read ones are
+            # left out so the notifications of users without the digest don't pile up in it
+            models.Index(
+                fields=['created_at'], condition=models.Q(is_read=False, emailed_at__isnull=True),
+                name='notification_unemailed_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'dedupe_key'],
+                condition=models.Q(dedupe_key__isnull=False),
+                name='unique_notification_dedupe_key'
+            )
         ]
     
     def __str__(self):
@@ -487,6 +677,30 @@ class Notification(models.Model):
             self.read_at = timezone.now()
             self.save()
 
+class NotificationArchive(models.Model):
+    """
+    Compact copy of a read notification past the retention window, moved here
+    by memorials.retention so the live Notification table stays small. Keeps
+    the original id; message and links are dropped.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    notification_type = models.CharField(max_length=50, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    related_memorial = models.ForeignKey('Memorial', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    read_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.title} (archived)"
+
 class SmartMatchSuggestion(models.Model):
     """Tracks AI-generated family relationship suggestions"""
     STATUS_CHOICES = [
@@ -526,4 +740,42 @@ class SmartMatchSuggestion(models.Model):
         ]
     
     def __str__(self):
-        return f"Match: {self.my_memorial.full_name} ↔ {self.suggested_memorial.full_name} ({self.confidence_score}%)"
\ No newline at end of file
+        return f"Match: {self.my_memorial.full_name} ↔ {self.suggested_memorial.full_name} ({self.confidence_score}%)"
+
+class Job(models.Model):
+    """
+    A queued background task (memorials.jobs): the task's registered name and
+    its JSON arguments. Workers claim queued rows, run them and delete them on
+    success; failures are retried with backoff, then kept as 'failed'.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_retries = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    
+    # Set while a worker holds the job; a lock older than JOB_LOCK_TIMEOUT is reclaimed.
+    # Holds memorials.jobs' claim token: worker id (host:pid:thread), cut to fit, plus a random suffix
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # The workers' "next due job" scan
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status='queued'), name='job_queued_idx'),
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='job_running_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
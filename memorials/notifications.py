@@ -0,0 +1,149 @@
+# ============================================================================
+# notifications.py - Idempotent Notification inserts
+# ============================================================================
+#
+# Every producer builds unsaved Notification objects and hands them to
+# create_notifications(). Each carries a deterministic dedupe_key for the
+# event it's about; (user, dedupe_key) is unique, so the insert is a single
+# bulk INSERT that skips rows that already exist. No read-before-write, and
+# two overlapping runs of a job can't notify anyone twice.
+#
+# Request handlers use enqueue_notifications() instead: the rows are handed
+# to a per-process buffer when the request's transaction commits, and a
+# background thread writes whatever has accumulated every
+# NOTIFICATION_FLUSH_INTERVAL seconds (sooner once a batch is full). The
+# request never waits on the inserts, however many recipients there are.
+# The buffer lives in memory: rows still in it when a process is killed
+# outright are lost; a normal exit flushes it. If the database can't be
+# reached the rows go back into the buffer for the next flush; if a batch is
+# rejected it's retried row by row, so only the bad rows are dropped.
+#
+# The inbox pages through them newest first with keyset cursors on
+# NOTIFICATION_ORDERING, which the (user, is_read, -created_at, -id) index
+# serves directly.
+
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+from .inbox import invalidate_inbox
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_ORDERING = ('-created_at', '-id')
+
+# Errors from a database that's unreachable or busy, rather than from the rows
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def dedupe_key(notification_type, *parts):
+    """'<type>:<parts...>', e.g. 'death_anniversary:42:2026-10-26:7'"""
+    return ':'.join([notification_type, *map(str, parts)])
+
+
+def create_notifications(notifications, batch_size=1000):
+    """
+    Insert `notifications`, skipping any whose (user, dedupe_key) already
+    exists. bulk_create skips signals, so the recipients' inbox counters are
+    invalidated here.
+    """
+    if not notifications:
+        return
+    Notification.objects.bulk_create(notifications, batch_size=batch_size, ignore_conflicts=True)
+    invalidate_inbox(*{notification.user_id for notification in notifications})
+
+
+class NotificationBuffer:
+    """Notifications waiting to be inserted, written in batches by a background thread"""
+
+    def __init__(self):
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._retrying = False
+
+    def add(self, notifications):
+        with self._condition:
+            self._pending.extend(notifications)
+            # Started lazily, so each (forked) worker process gets its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-flusher', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= settings.NOTIFICATION_FLUSH_BATCH_SIZE:
+                self._condition.notify()
+
+    def flush(self):
+        """Insert everything buffered so far; returns the number of notifications written"""
+        with self._condition:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            create_notifications(pending, batch_size=settings.NOTIFICATION_FLUSH_BATCH_SIZE)
+            return len(pending)
+        except TRANSIENT_ERRORS:
+            logger.warning('Database error, keeping %d buffered notifications', len(pending), exc_info=True)
+            self._requeue(pending)
+            return 0
+        except Exception:
+            # One bad row fails its whole INSERT: write them one by one instead
+            return self._write_each(pending)
+        finally:
+            close_old_connections()
+
+    def _write_each(self, pending):
+        written = 0
+        for index, notification in enumerate(pending):
+            try:
+                create_notifications([notification])
+            except TRANSIENT_ERRORS:
+                logger.warning('Database error, keeping %d buffered notifications', len(pending) - index, exc_info=True)
+                self._requeue(pending[index:])
+                break
+            except Exception:
+                logger.exception('Dropped buffered notification %s for user %s', notification.dedupe_key, notification.user_id)
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, notifications):
+        """Put `notifications` back at the front of the buffer; the flusher retries them after its interval"""
+        with self._condition:
+            self._pending[:0] = notifications
+            self._retrying = True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # A batch that filled up while this thread was starting or
+                # flushing was notified with nobody waiting: don't wait for it.
+                # After a database error, do wait, rather than retry at once
+                if self._retrying or len(self._pending) < settings.NOTIFICATION_FLUSH_BATCH_SIZE:
+                    self._retrying = False
+                    self._condition.wait(settings.NOTIFICATION_FLUSH_INTERVAL)
+            self.flush()
+
+
+buffer = NotificationBuffer()
+atexit.register(buffer.flush)
+
+
+def enqueue_notifications(notifications):
+    """
+    Write-behind create_notifications(): the rows are buffered once the current
+    transaction commits (and never if it rolls back), then inserted by the
+    flusher thread. With NOTIFICATION_WRITE_BEHIND off they're inserted on
+    commit, in the caller's thread.
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return
+    if settings.NOTIFICATION_WRITE_BEHIND:
+        transaction.on_commit(lambda: buffer.add(notifications))
+    else:
+        transaction.on_commit(lambda: create_notifications(notifications))
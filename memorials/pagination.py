@@ -0,0 +1,142 @@
+# ============================================================================
+# pagination.py - Keyset (cursor) pagination
+# ============================================================================
+#
+# Instead of COUNT(*) + OFFSET, each page continues from the sort key of the
+# last row shown ("seek method"), so page 1000 costs the same as page 1 as
+# long as the ordering is backed by an index. Cursors are signed, so clients
+# can't forge positions, and opaque to the template.
+
+import datetime
+from collections.abc import Sequence
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+
+class KeysetPage(Sequence):
+    """One page of results plus the cursors to its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` by `ordering`, e.g. ('-created_at', '-id').
+    The last ordering field must be unique so every row has a distinct position.
+    `queryset` may be a values() queryset, as long as it selects the ordering fields.
+    """
+
+    def __init__(self, queryset, ordering, per_page, salt='memorials.pagination'):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.salt = salt
+        self.keys = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def get_page(self, cursor=None):
+        """Return the page after/before `cursor`; a missing or invalid cursor gives the first page"""
+        position = self._decode_cursor(cursor)
+
+        if position is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = False
+        elif position['d'] == 'p':
+            # Walk backwards from the cursor, then flip the rows into display order
+            reverse = [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+            rows = list(
+                self.queryset.filter(self._seek_filter(position['k'], backwards=True))
+                .order_by(*reverse)[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            rows = list(
+                self.queryset.filter(self._seek_filter(position['k']))
+                .order_by(*self.ordering)[:self.per_page + 1]
+            )
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = True
+
+        next_cursor = self._encode_cursor(rows[-1], 'n') if rows and has_next else None
+        previous_cursor = self._encode_cursor(rows[0], 'p') if rows and has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def is_valid_cursor(self, cursor):
+        """Whether `cursor` is a position this paginator signed (and get_page would honour)"""
+        return self._decode_cursor(cursor) is not None
+
+    def _seek_filter(self, values, backwards=False):
+        """
+        Rows strictly after (or before) `values` in ordering order:
+            k0 > v0 OR (k0 = v0 AND k1 > v1) OR ...
+        plus an inclusive bound on k0 so the database can range-scan the index.
+        """
+        condition = Q()
+        equal_prefix = Q()
+        for (name, descending), value in zip(self.keys, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal_prefix & Q(**{f'{name}__{lookup}': value})
+            equal_prefix &= Q(**{name: value})
+
+        name, descending = self.keys[0]
+        bound = 'lte' if descending != backwards else 'gte'
+        return Q(**{f'{name}__{bound}': values[0]}) & condition
+
+    def _encode_cursor(self, obj, direction):
+        values = []
+        for name, _ in self.keys:
+            value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            values.append(value)
+        return signing.dumps({'k': values, 'd': direction}, salt=self.salt, compress=True)
+
+    def _decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            position = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            return None
+        if not isinstance(position, dict) or len(position.get('k', ())) != len(self.keys):
+            return None
+
+        # Turn ISO strings back into dates/datetimes using the model fields
+        values = []
+        for (name, _), value in zip(self.keys, position['k']):
+            try:
+                field = self.queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                values.append(value)  # annotation such as search_rank
+            else:
+                values.append(field.to_python(value))
+        return {'k': values, 'd': position.get('d', 'n')}
@@ -0,0 +1,65 @@
+# ============================================================================
+# retention.py - Archiving old read notifications
+# ============================================================================
+#
+# Read notifications older than NOTIFICATION_RETENTION_DAYS move from the live
+# Notification table to the compact NotificationArchive. The move runs in
+# small chunks, each its own short transaction (copy, then delete by primary
+# key), so no statement scans or locks more than one chunk of rows and the
+# job can be stopped and resumed at any point.
+#
+# Rows are deleted with plain SQL: Notification's post_delete receivers only
+# invalidate unread badge counts, which read notifications don't affect, and
+# QuerySet.delete() would load every row to send them.
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'notification_type', 'title', 'related_memorial_id', 'created_at', 'read_at')
+
+
+def expired_notifications(days=None):
+    """Read notifications created more than `days` (default NOTIFICATION_RETENTION_DAYS) ago, oldest first"""
+    days = settings.NOTIFICATION_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    return Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('created_at', 'id')
+
+
+def _delete_notifications(ids):
+    connection = connections[router.db_for_write(Notification)]
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+        return cursor.rowcount
+
+
+def archive_notifications(days=None, batch_size=None, pause=0):
+    """
+    Move expired notifications to the archive, `batch_size` rows per
+    transaction, sleeping `pause` seconds between chunks. Yields the number of
+    rows moved per chunk.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_PRUNE_BATCH_SIZE
+    expired = expired_notifications(days).values(*ARCHIVED_FIELDS)
+
+    while True:
+        with transaction.atomic():
+            rows = list(expired[:batch_size])
+            if not rows:
+                return
+            # The original id is the archive's primary key, so a re-copied row is skipped
+            NotificationArchive.objects.bulk_create(
+                [NotificationArchive(**row) for row in rows], ignore_conflicts=True,
+            )
+            moved = _delete_notifications([row['id'] for row in rows])
+        yield moved
+
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,201 @@
+# ============================================================================
+# search.py - Ranked full-text search for memorials
+# ============================================================================
+#
+# PostgreSQL: a weighted tsvector in Memorial.search_vector with a GIN index.
+# SQLite: an FTS5 shadow table keyed by the memorial id (rowid), mapped by
+# the unmanaged MemorialSearchEntry model so searches can join it.
+# Any other backend (or SQLite built without FTS5) falls back to icontains.
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, router
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Memorial, normalize_name
+
+SEARCH_CONFIG = 'simple'  # Names and stories are multilingual, so no stemming
+FTS_TABLE = 'memorials_memorial_fts'
+
+# Column weights: name matches count most, then country, then story
+POSTGRES_VECTOR_SQL = (
+    "setweight(to_tsvector(%(config)s, coalesce(v.full_name, '')), 'A') || "
+    "setweight(to_tsvector(%(config)s, coalesce(v.country_name, '')), 'B') || "
+    "setweight(to_tsvector(%(config)s, coalesce(v.story, '')), 'C')"
+)
+FTS_RANK_WEIGHTS = (10.0, 4.0, 1.0)
+
+AUTOCOMPLETE_LIMIT = 10
+
+
+def search_backend(using='default'):
+    """Return 'postgresql', 'fts5' or None for the given database alias"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite' and _fts_table_exists(connection):
+        return 'fts5'
+    return None
+
+
+def _fts_table_exists(connection):
+    """Cache a positive FTS5 table lookup on the connection wrapper"""
+    if getattr(connection, '_memorials_fts_exists', False):
+        return True
+    exists = FTS_TABLE in connection.introspection.table_names()
+    connection._memorials_fts_exists = exists
+    return exists
+
+
+def _fts_match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, last word as prefix"""
+    terms = ['"%s"' % word.replace('"', '""') for word in query.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_memorials(queryset, query):
+    """
+    Filter a Memorial queryset to rows matching `query` and annotate
+    `search_rank` (higher is more relevant).
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+
+    backend = search_backend(queryset.db)
+
+    if backend == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+
+    if backend == 'fts5':
+        # Join the FTS table (MemorialSearchEntry) so MATCH and bm25() run once per query;
+        # bm25() is lower-is-better, flip it so both backends sort descending
+        return queryset.filter(
+            search_entry__isnull=False
+        ).filter(
+            RawSQL(f"{FTS_TABLE} MATCH %s", [_fts_match_expression(query)], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"-bm25({FTS_TABLE}, %s, %s, %s)", FTS_RANK_WEIGHTS, output_field=FloatField())
+        )
+
+    # No full-text index available: keep the old substring search, unranked
+    return queryset.filter(
+        Q(full_name__icontains=query) |
+        Q(story__icontains=query) |
+        Q(country__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def autocomplete_memorials(queryset, prefix, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Memorials whose normalized name starts with `prefix`, in name order.
+    The range bounds let the database seek straight into the search_name
+    index; startswith keeps the result exact whatever the column collation.
+    """
+    prefix = normalize_name(prefix)
+    if not prefix:
+        return queryset.none()
+    upper = prefix[:-1] + chr(min(ord(prefix[-1]) + 1, 0x10FFFF))
+    return queryset.filter(
+        search_name__gte=prefix,
+        search_name__lt=upper,
+        search_name__startswith=prefix,
+    ).order_by('search_name', 'id')[:limit]
+
+
+def _index_rows(memorials):
+    """Build (id, full_name, country name, story) tuples for indexing"""
+    return [
+        (m.id, m.full_name, m.country.name if m.country else '', m.story)
+        for m in memorials
+    ]
+
+
+def write_index(rows, using='default'):
+    """Write index entries for the given (id, full_name, country_name, story) rows"""
+    if not rows:
+        return
+    backend = search_backend(using)
+    connection = connections[using]
+
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            values = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+            params = [value for row in rows for value in row]
+            vector_sql = POSTGRES_VECTOR_SQL % {'config': "'%s'" % SEARCH_CONFIG}
+            cursor.execute(
+                f"UPDATE {Memorial._meta.db_table} AS m SET search_vector = {vector_sql} "
+                f"FROM (VALUES {values}) AS v(id, full_name, country_name, story) "
+                f"WHERE m.id = v.id",
+                params,
+            )
+        elif backend == 'fts5':
+            ids = [row[0] for row in rows]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", ids)
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, full_name, country, story) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+def index_memorial(memorial):
+    """Refresh the search index entry for a single memorial"""
+    using = router.db_for_write(Memorial, instance=memorial)
+    write_index(_index_rows([memorial]), using=using)
+
+
+def remove_memorial(memorial_id, using='default'):
+    """Drop a memorial from the SQLite FTS table (PostgreSQL rows go with the memorial)"""
+    if search_backend(using) == 'fts5':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [memorial_id])
+
+
+def rebuild_index(queryset, batch_size=1000):
+    """Re-index every memorial in `queryset`, yielding the running total after each batch"""
+    using = queryset.db
+    if search_backend(using) == 'fts5':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    batch = []
+    total = 0
+    for memorial in queryset.only('id', 'full_name', 'country', 'story').iterator(chunk_size=batch_size):
+        batch.append(memorial)
+        if len(batch) >= batch_size:
+            write_index(_index_rows(batch), using=using)
+            total += len(batch)
+            batch = []
+            yield total
+    if batch:
+        write_index(_index_rows(batch), using=using)
+        total += len(batch)
+        yield total
+
+
+# ----------------------------------------------------------------------------
+# Keep the index in sync on save/delete
+# ----------------------------------------------------------------------------
+
+@receiver(post_save, sender=Memorial)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """post_save receiver: re-index when any indexed field may have changed"""
+    if raw:
+        return
+    if update_fields is not None and not {'full_name', 'country', 'story'} & set(update_fields):
+        return
+    index_memorial(instance)
+
+
+@receiver(post_delete, sender=Memorial)
+def delete_search_index(sender, instance, using='default', **kwargs):
+    """post_delete receiver"""
+    remove_memorial(instance.id, using=using)
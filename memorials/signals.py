@@ -4,11 +4,15 @@
 
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from .models import Memorial
 from .tasks import generate_smart_matches_for_memorial
 
 @receiver(post_save, sender=Memorial)
-def trigger_smart_matching(sender, instance, created, update_fields, **kwargs):
-    """Auto-trigger smart matching when memorial is created/approved"""
+def trigger_smart_matching(sender, instance, created, update_fields, raw=False, **kwargs):
+    """Auto-trigger smart matching when memorial is created/approved (queued for run_worker)"""
+    if raw:
+        return
+    
     if created and instance.approved:
         generate_smart_matches_for_memorial.delay(instance.id)
     
@@ -1,13 +1,17 @@
 # ============================================================================
-# tasks.py - Celery tasks for background matching
+# tasks.py - Background tasks for smart matching (run by manage.py run_worker)
 # ============================================================================
 
-from celery import shared_task
+from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils import timezone
 import logging
 
+from .jobs import shared_task
+from .matching_algorithm import find_potential_matches
+from .models import Memorial, SmartMatchSuggestion
+
 logger = logging.getLogger(__name__)
 
 @shared_task
@@ -82,13 +86,13 @@ def send_smart_match_email(user, suggestions):
         'total_matches': len(suggestions),
     }
     
-    html_message = render_to_string('notifications/smart_match_email.html', context)
-    text_message = render_to_string('notifications/smart_match_email.txt', context)
+    html_message = render_to_string('registration/notifications/smart_match_email.html', context)
+    text_message = render_to_string('registration/notifications/smart_match_email.txt', context)
     
     send_mail(
         subject,
         text_message,
-        'noreply@memorialheritage.com',
+        settings.DEFAULT_FROM_EMAIL,
         [user.email],
         html_message=html_message,
         fail_silently=False,
@@ -1,3 +1,975 @@
-from django.test import TestCase
+import asyncio
+import json
+import smtplib
+import threading
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core import mail
+from django.core.cache import caches
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .anniversaries import (
+    build_calendar, calendar_needs_build, observed_date, observed_month_days, rebuild_calendar,
+    send_scheduled_notifications,
+)
+from .browse import DEFAULT_SORT, SORT_MODES, get_facets, parse_browse_filters, resolve_sort, results_cache_key
+from .digest import send_daily_digests
+from .family import family_owner_ids
+from .jobs import Worker, claim_jobs, requeue_stale_jobs, run_job, shared_task
+from .live import broker, inbox_events, with_inbox_stream
+from .models import FamilyRelationship, Job, Memorial, MemorialPhoto, Notification, NotificationArchive, ScheduledNotification, UserProfile
+from .notifications import NotificationBuffer, create_notifications, dedupe_key, enqueue_notifications
+from .pagination import KeysetPaginator
+from .retention import archive_notifications
+from .search import search_backend, search_memorials
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+# Tasks for the job queue tests
+task_calls = []
+task_calls_lock = threading.Lock()
+
+
+@shared_task(name='memorials.tests.record')
+def record(value, sleep=0):
+    time.sleep(sleep)
+    with task_calls_lock:
+        task_calls.append(value)
+
+
+@shared_task(name='memorials.tests.explode', max_retries=1)
+def explode():
+    raise RuntimeError('boom')
+
+
+@shared_task(name='memorials.tests.outlive_lock')
+def outlive_lock():
+    # Runs past JOB_LOCK_TIMEOUT; the heartbeat must keep it from looking stale
+    time.sleep(0.4)
+    task_calls.append(requeue_stale_jobs())
+
+
+class BrowseSortModeTests(TestCase):
+    """Every declared browse sort mode must be served by its composite index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='sorter', password='not-used')
+        memorials = []
+        for i in range(60):
+            memorial = Memorial(
+                full_name=f'Person {i:03d}',
+                dob=date(1900 + i, 1 + i % 12, 1),
+                dod=date(1980 + i % 40, 6, 1),
+                story='A life remembered.',
+                country='US',
+                approved=i % 4 != 0,
+                created_by=user,
+            )
+            memorial.populate_derived_fields()
+            memorials.append(memorial)
+        Memorial.objects.bulk_create(memorials)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny, so the planner would otherwise just scan them
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def page_queries(self, ordering, cursor=None):
+        """SQL run to fetch one browse page"""
+        paginator = KeysetPaginator(Memorial.objects.filter(approved=True), ordering, 20)
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.get_page(cursor)
+        return page, [query['sql'] for query in queries.captured_queries]
+
+    def test_every_mode_uses_its_index(self):
+        for key, mode in SORT_MODES.items():
+            if mode['index'] is None:
+                continue  # relevance is ordered by the computed rank
+            with self.subTest(sort=key):
+                first_page, first_sql = self.page_queries(mode['ordering'])
+                self.assertTrue(first_page.has_next)
+                _, next_sql = self.page_queries(mode['ordering'], first_page.next_cursor)
+
+                for sql in first_sql + next_sql:
+                    self.assertIn(mode['index'], self.explain(sql))
+
+    def test_every_ordering_ends_with_id(self):
+        for key, mode in SORT_MODES.items():
+            with self.subTest(sort=key):
+                self.assertIn(mode['ordering'][-1], ('id', '-id'))
+
+    def test_unknown_sort_falls_back_to_default(self):
+        self.assertEqual(resolve_sort('story'), DEFAULT_SORT)
+        self.assertEqual(resolve_sort('relevance'), DEFAULT_SORT)
+        self.assertEqual(resolve_sort('', query='smith'), 'relevance')
+        self.assertEqual(resolve_sort('-dod', query='smith'), '-dod')
+
+
+class MemorialSearchTests(TestCase):
+    """The full-text index follows saves and deletes, and ranks name matches first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', password='not-used')
+
+    def setUp(self):
+        if search_backend() is None:
+            self.skipTest('no full-text backend on this database')
+
+    def create(self, full_name, story='A life remembered.', country='US'):
+        return Memorial.objects.create(
+            full_name=full_name, dob=date(1920, 3, 4), dod=date(1990, 5, 6),
+            story=story, country=country, approved=True, created_by=self.user,
+        )
+
+    def search(self, query):
+        return list(search_memorials(Memorial.objects.all(), query).order_by('-search_rank', 'id'))
+
+    def test_index_follows_save_and_delete(self):
+        memorial = self.create('Ada Lovelace')
+        self.assertEqual(self.search('lovelace'), [memorial])
+
+        memorial.full_name = 'Ada King'
+        memorial.save()
+        self.assertEqual(self.search('lovelace'), [])
+        self.assertEqual(self.search('king'), [memorial])
+
+        memorial.delete()
+        self.assertEqual(self.search('king'), [])
+
+    def test_name_match_outranks_story_match(self):
+        in_story = self.create('Grace Hopper', story='She worked with Turing on codes.')
+        in_name = self.create('Alan Turing')
+        self.assertEqual(self.search('turing'), [in_name, in_story])
+
+    def test_last_word_matches_as_prefix(self):
+        memorial = self.create('Marie Curie', country='FR')
+        self.assertEqual(self.search('marie cur'), [memorial])
+        self.assertEqual(self.search('france'), [memorial])
+
+
+class KeysetPaginatorTests(TestCase):
+    """Cursors walk every row exactly once, forwards and backwards, across duplicate sort keys"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='pager', password='not-used')
+        memorials = []
+        for i in range(45):
+            # Only five distinct death dates, so pages break inside runs of equal keys
+            memorial = Memorial(
+                full_name=f'Person {i:03d}', dob=date(1900, 1, 1), dod=date(1980 + i % 5, 6, 1),
+                story='A life remembered.', country='US', approved=True, created_by=user,
+            )
+            memorial.populate_derived_fields()
+            memorials.append(memorial)
+        Memorial.objects.bulk_create(memorials)
+        cls.ordering = ('-dod', '-id')
+        cls.expected = list(Memorial.objects.order_by(*cls.ordering).values_list('id', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Memorial.objects.all(), self.ordering, 10)
+
+    def test_forward_then_backward(self):
+        paginator = self.paginator()
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 10, 10, 5])
+        self.assertEqual([m.id for page in pages for m in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+
+        # Walking back from the last page revisits the same pages in reverse
+        page = pages[-1]
+        for earlier in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual([m.id for m in page], [m.id for m in earlier])
+        self.assertFalse(page.has_previous)
+
+    def test_tampered_cursor_gives_first_page(self):
+        paginator = self.paginator()
+        cursor = paginator.get_page().next_cursor
+        page = paginator.get_page(cursor[:-2] + 'xx')
+        self.assertEqual([m.id for m in page], self.expected[:10])
+        self.assertFalse(page.has_previous)
+
+
+class BrowseFacetTests(TestCase):
+    """Each facet is counted without its own filter, so a chosen value keeps its alternatives"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='faceter', password='not-used')
+        memorials = []
+        for i, (country, born) in enumerate([('US', 1900), ('US', 1910), ('FR', 1910), ('DE', 1920)]):
+            memorial = Memorial(
+                full_name=f'Person {i}', dob=date(born, 1, 1), dod=date(1990, 1, 1),
+                story='A life remembered.', country=country, approved=True, created_by=user,
+            )
+            memorial.populate_derived_fields()
+            memorials.append(memorial)
+        Memorial.objects.bulk_create(memorials)
+
+    def setUp(self):
+        clear_caches()
+
+    def facets(self, **params):
+        return get_facets(Memorial.objects.filter(approved=True), parse_browse_filters(params))
+
+    def counts(self, facets):
+        return {facet['value']: facet['count'] for facet in facets}
+
+    def test_country_filter_keeps_other_countries(self):
+        facets = self.facets(country='US')
+        self.assertEqual(self.counts(facets['country']), {'US': 2, 'FR': 1, 'DE': 1})
+        # The other facets are narrowed to US memorials
+        self.assertEqual(self.counts(facets['birth_decade']), {'1900-1909': 1, '1910-1919': 1})
+
+    def test_decade_filter_keeps_other_decades(self):
+        facets = self.facets(birth_year='1910-1919')
+        self.assertEqual(self.counts(facets['birth_decade']), {'1900-1909': 1, '1910-1919': 2, '1920-1929': 1})
+        self.assertEqual(self.counts(facets['country']), {'US': 1, 'FR': 1})
+
+
+class BrowsePageTests(TestCase):
+    """The results header reflects the (cached) result fragment"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='browser', password='not-used')
+        for i in range(3):
+            Memorial.objects.create(
+                full_name=f'Person {i}', dob=date(1900, 1, 1), dod=date(1990, 1, 1),
+                story='A life remembered.', country='US', approved=True, created_by=user,
+            )
+
+    def setUp(self):
+        clear_caches()
+
+    def test_header_on_cache_miss_and_hit(self):
+        for attempt in ('miss', 'hit'):
+            with self.subTest(cache=attempt):
+                response = self.client.get('/browse/')
+                self.assertContains(response, '3 memorials found')
+                self.assertNotContains(response, 'No memorials found')
+
+    def test_header_without_results(self):
+        response = self.client.get('/browse/', {'country': 'FR'})
+        self.assertContains(response, 'No memorials found')
+
+    def test_forged_cursor_shares_first_page_key(self):
+        filters = parse_browse_filters({})
+        response = self.client.get('/browse/', {'cursor': 'forged'})
+        self.assertContains(response, '3 memorials found')
+
+        fragments = caches['fragments']
+        self.assertIsNotNone(fragments.get(results_cache_key(filters, DEFAULT_SORT, '', 'en')))
+        self.assertIsNone(fragments.get(results_cache_key(filters, DEFAULT_SORT, 'forged', 'en')))
+
+
+class MemorialSearchApiTests(TestCase):
+    """The JSON search API: field selection, cursor paging and the ndjson export"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='api', password='not-used')
+        for i in range(5):
+            Memorial.objects.create(
+                full_name=f'Person {i}', dob=date(1900 + i, 1, 1), dod=date(1990, 1, 1),
+                story='A life remembered.', country='US', approved=True, created_by=user,
+            )
+        Memorial.objects.create(
+            full_name='Pending', dob=date(1950, 1, 1), dod=date(1990, 1, 1),
+            story='A life remembered.', country='US', approved=False, created_by=user,
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('memorial_search_api'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_selected_fields_only(self):
+        response = self.client.get(reverse('memorial_search_api'), {'fields': 'id,full_name', 'limit': 1})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'full_name'})
+
+    def test_cursor_round_trip(self):
+        url = reverse('memorial_search_api')
+        params = {'fields': 'full_name', 'sort': 'full_name', 'limit': 2}
+        names, cursor, pages = [], None, []
+        while True:
+            data = self.client.get(url, {**params, 'cursor': cursor} if cursor else params).json()
+            pages.append(data)
+            names += [row['full_name'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(names, [f'Person {i}' for i in range(5)])
+        self.assertEqual(len(pages), 3)
+
+        # Going back from the last page returns the page before it
+        back = self.client.get(url, {**params, 'cursor': pages[-1]['previous_cursor']}).json()
+        self.assertEqual(back['results'], pages[1]['results'])
+
+    def test_ndjson_streams_every_match(self):
+        response = self.client.get(reverse('memorial_search_api'), {'format': 'ndjson', 'fields': 'id,dob', 'sort': 'full_name'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['dob'], '1900-01-01')
+
+
+class ConditionalGetTests(TestCase):
+    """Memorial pages answer revalidation with 304 until the memorial or its photos change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='viewer', password='not-used')
+        cls.memorial = Memorial.objects.create(
+            full_name='Kept Fresh', dob=date(1920, 1, 1), dod=date(1990, 1, 1),
+            story='A life remembered.', country='US', approved=True, created_by=cls.user,
+        )
+        cls.photo = MemorialPhoto.objects.create(memorial=cls.memorial, photo='', caption='First')
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.user)
+        self.urls = {
+            'gallery': reverse('memorial_photo_gallery', args=[self.memorial.id]),
+            'photos_json': reverse('get_memorial_photos_json', args=[self.memorial.id]),
+            'family_tree': reverse('family_tree', args=[self.memorial.id]),
+        }
+
+    def test_if_none_match(self):
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.has_header('ETag'))
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        # Only the public JSON carries Last-Modified; the HTML pages vary by viewer
+        response = self.client.get(self.urls['photos_json'])
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.urls['photos_json'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_photo_edit_changes_etag(self):
+        etags = {name: self.client.get(url)['ETag'] for name, url in self.urls.items()}
+
+        self.photo.caption = 'Second'
+        self.photo.save()
+
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etags[name])
+
+
+class AnniversaryCalendarTests(TestCase):
+    """The materialized calendar: which reminders are scheduled, and sending them once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='not-used')
+        UserProfile.objects.create(user=cls.owner, is_premium=True, notify_birthdays=False)
+        # Died on a leap day; 2027 is a common year, 2028 a leap year
+        cls.memorial = Memorial.objects.create(
+            full_name='Leap Day', dob=date(1930, 7, 1), dod=date(2000, 2, 29),
+            story='A life remembered.', country='US', approved=True, created_by=cls.owner,
+        )
+
+    def scheduled(self):
+        return sorted(
+            ScheduledNotification.objects.filter(is_sent=False)
+            .values_list('scheduled_date', 'days_before', 'notification_type', 'year_count')
+        )
+
+    def test_leap_day_dates(self):
+        self.assertEqual(observed_date(date(2000, 2, 29), 2027), date(2027, 2, 28))
+        self.assertEqual(observed_date(date(2000, 2, 29), 2028), date(2028, 2, 29))
+        self.assertEqual(observed_month_days(date(2027, 2, 28)), [228, 229])
+        self.assertEqual(observed_month_days(date(2028, 2, 28)), [228])
+
+    def test_leap_day_observed_on_feb_28_in_common_years(self):
+        rebuild_calendar([self.memorial.pk], today=date(2027, 1, 1))
+        self.assertEqual(self.scheduled(), [
+            (date(2027, 2, 21), 7, 'death_anniversary', 27),
+            (date(2027, 2, 27), 1, 'death_anniversary', 27),
+            (date(2027, 2, 28), 0, 'death_anniversary', 27),
+        ])
+
+    def test_leap_day_kept_in_leap_years(self):
+        rebuild_calendar([self.memorial.pk], today=date(2027, 6, 1))
+        self.assertEqual(
+            [row[0] for row in self.scheduled()],
+            [date(2028, 2, 22), date(2028, 2, 28), date(2028, 2, 29)],
+        )
+
+    def test_recipient_timing_preferences(self):
+        UserProfile.objects.filter(user=self.owner).update(notify_week_before=False, notify_day_before=False)
+        rebuild_calendar([self.memorial.pk], today=date(2027, 1, 1))
+        self.assertEqual([row[:2] for row in self.scheduled()], [(date(2027, 2, 28), 0)])
+
+    def test_free_owner_gets_nothing(self):
+        UserProfile.objects.filter(user=self.owner).update(is_premium=False)
+        rebuild_calendar([self.memorial.pk], today=date(2027, 1, 1))
+        self.assertEqual(self.scheduled(), [])
+
+    def test_build_fills_empty_calendar(self):
+        ScheduledNotification.objects.all().delete()
+        self.assertTrue(calendar_needs_build())
+        self.assertEqual(list(build_calendar(date(2027, 1, 1)))[-1], Memorial.objects.count())
+        self.assertEqual(len(self.scheduled()), 3)
+        self.assertFalse(calendar_needs_build())
+
+    def test_due_reminders_are_sent_once(self):
+        rebuild_calendar([self.memorial.pk], today=date(2027, 1, 1))
+        self.assertEqual(sum(send_scheduled_notifications(date(2027, 2, 27))), 1)
+        self.assertEqual(sum(send_scheduled_notifications(date(2027, 2, 27))), 0)
+
+        notification = Notification.objects.get(user=self.owner)
+        self.assertEqual(notification.notification_type, 'death_anniversary')
+        self.assertIn('tomorrow (February 28, 2027)', notification.message)
+
+    def test_saves_queue_a_rebuild(self):
+        Job.objects.all().delete()
+        self.memorial.dod = date(2001, 3, 1)
+        self.memorial.save()
+        job = Job.objects.get(task='memorials.anniversaries.rebuild_calendar')
+        self.assertEqual(job.args, [[self.memorial.pk]])
+
+
+class NotificationDedupeTests(TestCase):
+    """(user, dedupe_key) is unique, so repeating an insert notifies nobody twice"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='not-used')
+        cls.bob = User.objects.create_user(username='bob', password='not-used')
+
+    def notification(self, user, *key_parts):
+        return Notification(
+            user=user, notification_type='death_anniversary', title='Anniversary', message='Soon.',
+            dedupe_key=dedupe_key('death_anniversary', *key_parts),
+        )
+
+    def test_repeated_insert_is_skipped(self):
+        create_notifications([self.notification(self.alice, 42, '2026-10-26', 7)])
+        create_notifications([
+            self.notification(self.alice, 42, '2026-10-26', 7),
+            self.notification(self.alice, 42, '2026-10-26', 1),
+            self.notification(self.bob, 42, '2026-10-26', 7),
+        ])
+        self.assertEqual(
+            sorted(Notification.objects.values_list('user__username', 'dedupe_key')),
+            [
+                ('alice', 'death_anniversary:42:2026-10-26:1'),
+                ('alice', 'death_anniversary:42:2026-10-26:7'),
+                ('bob', 'death_anniversary:42:2026-10-26:7'),
+            ],
+        )
+
+    def test_duplicates_within_one_batch(self):
+        create_notifications([self.notification(self.alice, 7, '2027-01-01', 0)] * 3)
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class FamilyFanOutTests(TestCase):
+    """family_owner_ids follows approved relationships transitively and stays current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owners = [User.objects.create_user(username=f'owner{i}', password='not-used') for i in range(5)]
+        cls.memorials = [
+            Memorial.objects.create(
+                full_name=f'Person {i}', dob=date(1900 + i, 1, 1), dod=date(1980, 1, 1),
+                story='A life remembered.', country='US', approved=i != 3, created_by=owner,
+            )
+            for i, owner in enumerate(cls.owners)
+        ]
+        # 0 - 1 - 2 - 0 (a cycle), 2 - 3 (unapproved memorial), 3 - 4 only pending
+        for a, b, status in [(0, 1, 'approved'), (1, 2, 'approved'), (2, 0, 'approved'),
+                             (2, 3, 'approved'), (3, 4, 'pending')]:
+            cls.relate(a, b, status)
+
+    @classmethod
+    def relate(cls, a, b, status='approved'):
+        return FamilyRelationship.objects.create(
+            person_a=cls.memorials[a], person_b=cls.memorials[b], relationship_type='sibling',
+            created_by=cls.owners[a], status=status,
+        )
+
+    def setUp(self):
+        clear_caches()
+
+    def owner_ids(self, index):
+        return family_owner_ids(self.memorials[index].pk)
+
+    def expected(self, *indexes):
+        return frozenset(self.owners[i].pk for i in indexes)
+
+    def test_approved_owners_of_connected_memorials(self):
+        self.assertEqual(self.owner_ids(0), self.expected(0, 1, 2))
+        self.assertEqual(self.owner_ids(3), self.expected(0, 1, 2))
+        self.assertEqual(self.owner_ids(4), self.expected(4))
+
+    def test_one_query_fills_the_whole_family(self):
+        self.owner_ids(0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.owner_ids(2), self.expected(0, 1, 2))
+        self.assertFalse([query for query in queries.captured_queries if 'RECURSIVE' in query['sql']])
+
+    def test_relationship_changes_invalidate(self):
+        self.assertEqual(self.owner_ids(4), self.expected(4))
+        self.relate(1, 4)
+        self.assertEqual(self.owner_ids(4), self.expected(0, 1, 2, 4))
+
+    def test_admin_approval_invalidates(self):
+        self.assertEqual(self.owner_ids(0), self.expected(0, 1, 2))
+
+        request = RequestFactory().post('/admin/memorials/memorial/')
+        request.user = User.objects.create_superuser(username='admin', password='not-used')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        Job.objects.all().delete()
+        admin.site._registry[Memorial].approve_memorials(
+            request, Memorial.objects.filter(pk__in=[self.memorials[0].pk, self.memorials[3].pk])
+        )
+
+        self.assertEqual(self.owner_ids(0), self.expected(0, 1, 2, 3))
+        # Smart matching is queued for the newly approved memorial only
+        self.assertEqual(
+            list(Job.objects.filter(task='memorials.tasks.generate_smart_matches_for_memorial').values_list('args', flat=True)),
+            [[self.memorials[3].pk]],
+        )
+
+
+class NotificationSettingsTests(TestCase):
+    """Free users can change the digest only; the anniversary settings are premium"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='settings', password='not-used')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def post_everything_off_but_digest(self):
+        return self.client.post(reverse('notification_settings'), {'email_daily_digest': 'on'})
+
+    def test_digest_is_opt_in(self):
+        self.assertFalse(self.profile.email_daily_digest)
+
+    def test_free_user_cannot_change_premium_fields(self):
+        response = self.post_everything_off_but_digest()
+        self.assertRedirects(response, reverse('notification_settings'))
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.email_daily_digest)
+        self.assertTrue(self.profile.enable_anniversary_notifications)
+        self.assertTrue(self.profile.notify_birthdays)
+
+    def test_premium_user_can_change_everything(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(is_premium=True)
+        self.post_everything_off_but_digest()
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.email_daily_digest)
+        self.assertFalse(self.profile.enable_anniversary_notifications)
+        self.assertFalse(self.profile.notify_birthdays)
+
+
+class DailyDigestTests(TestCase):
+    """One message per opted-in user, sent in batches, each notification emailed once"""
+
+    day = date(2026, 10, 18)
+
+    @classmethod
+    def setUpTestData(cls):
+        recipients = {'ann': 2, 'ben': 1, 'cat': 1}
+        for username, count in recipients.items():
+            user = User.objects.create_user(username=username, email=f'{username}@example.com', password='not-used')
+            UserProfile.objects.create(user=user, email_daily_digest=True)
+            cls.notify(user, count)
+
+        # Not opted in, no address, or read already: no digest
+        cls.notify(User.objects.create_user(username='dan', email='dan@example.com', password='not-used'), 1)
+        no_email = User.objects.create_user(username='eve', password='not-used')
+        UserProfile.objects.create(user=no_email, email_daily_digest=True)
+        cls.notify(no_email, 1)
+        Notification.objects.filter(user__username='cat').update(is_read=True)
+
+        # A notification from the day after isn't in this day's digest
+        late = cls.notify(User.objects.get(username='ann'), 1)
+        Notification.objects.filter(pk__in=late).update(
+            created_at=timezone.make_aware(datetime.combine(cls.day + timedelta(days=1), datetime.min.time()))
+        )
+
+    @classmethod
+    def notify(cls, user, count):
+        notifications = Notification.objects.bulk_create([
+            Notification(user=user, notification_type='relationship_suggested', title=f'Note {i}', message='Hello.')
+            for i in range(count)
+        ])
+        ids = [notification.pk for notification in notifications]
+        noon = timezone.make_aware(datetime.combine(cls.day, datetime.min.time()) + timedelta(hours=12))
+        Notification.objects.filter(pk__in=ids).update(created_at=noon)
+        return ids
+
+    def test_batches_share_one_connection(self):
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'open', wraps=connection.open) as opened, \
+                mock.patch.object(connection, 'send_messages', wraps=connection.send_messages) as sent:
+            self.assertEqual(list(send_daily_digests(self.day, batch_size=1, connection=connection)), [1, 1])
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(sent.call_count, 2)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ann@example.com', 'ben@example.com'])
+        ann = next(message for message in mail.outbox if message.to == ['ann@example.com'])
+        self.assertIn('2 new notifications', ann.subject)
+        self.assertEqual(len(ann.alternatives), 1)
+
+    def test_notifications_are_emailed_once(self):
+        sent = sum(send_daily_digests(self.day))
+        self.assertEqual(sent, 2)
+        self.assertEqual(Notification.objects.filter(emailed_at__isnull=False).count(), 3)
+
+        self.assertEqual(sum(send_daily_digests(self.day)), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_refused_recipient_stays_pending(self):
+        connection = mail.get_connection()
+        send_messages = connection.send_messages
+
+        def refuse_ann(messages):
+            if messages[0].to == ['ann@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'ann@example.com': (550, b'No such user')})
+            return send_messages(messages)
+
+        with mock.patch.object(connection, 'send_messages', side_effect=refuse_ann):
+            self.assertEqual(sum(send_daily_digests(self.day, connection=connection)), 1)
+
+        self.assertEqual([message.to for message in mail.outbox], [['ben@example.com']])
+        emailed = Notification.objects.filter(emailed_at__isnull=False)
+        self.assertEqual(list(emailed.values_list('user__username', flat=True)), ['ben'])
+
+        # Ann's digest goes out on the next run; Ben isn't emailed twice
+        self.assertEqual(sum(send_daily_digests(self.day)), 1)
+        self.assertEqual(mail.outbox[-1].to, ['ann@example.com'])
+
+
+class NotificationRetentionTests(TestCase):
+    """Expired read notifications move to the archive in chunks; everything else stays"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='reader', password='not-used')
+        old = timezone.now() - timedelta(days=120)
+        recent = timezone.now() - timedelta(days=10)
+        for created_at, is_read, count in [(old, True, 5), (old, False, 1), (recent, True, 1)]:
+            notifications = Notification.objects.bulk_create([
+                Notification(user=user, notification_type='relationship_approved', title='Approved', message='Yes.')
+                for _ in range(count)
+            ])
+            Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+                created_at=created_at, is_read=is_read,
+            )
+        cls.expired_ids = set(Notification.objects.filter(is_read=True, created_at=old).values_list('id', flat=True))
+
+    def test_moves_expired_in_chunks(self):
+        self.assertEqual(list(archive_notifications(days=90, batch_size=2)), [2, 2, 1])
+        self.assertEqual(set(NotificationArchive.objects.values_list('id', flat=True)), self.expired_ids)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(Notification.objects.filter(id__in=self.expired_ids).exists())
+
+    def test_rerun_after_partial_copy(self):
+        # A chunk copied but not deleted (e.g. interrupted) is finished without duplicates
+        expired = Notification.objects.get(id=min(self.expired_ids))
+        NotificationArchive.objects.create(
+            id=expired.id, user_id=expired.user_id, notification_type=expired.notification_type,
+            title=expired.title, created_at=expired.created_at,
+        )
+        self.assertEqual(sum(archive_notifications(days=90, batch_size=10)), 5)
+        self.assertEqual(NotificationArchive.objects.count(), 5)
+        self.assertEqual(list(archive_notifications(days=90)), [])
+
+
+@override_settings(INBOX_STREAM_KEEPALIVE=0.05, INBOX_STREAM_REFRESH_INTERVAL=300, INBOX_STREAM_POLL_INTERVAL=300)
+class InboxStreamTests(SimpleTestCase):
+    """The SSE generator: counts on connect, a new event only when they change, keepalives between"""
+
+    user = SimpleNamespace(pk=4242)
+
+    def setUp(self):
+        self.counts = {'unread_notifications': 1, 'pending_suggestions': 0, 'unreviewed_matches': 0}
+        patcher = mock.patch('memorials.live.get_inbox_counts', side_effect=lambda user: dict(self.counts))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counts_event(self):
+        return f'event: counts\ndata: {json.dumps(self.counts)}\n\n'
+
+    async def test_events(self):
+        events = inbox_events(self.user)
+        try:
+            self.assertEqual(await anext(events), 'retry: 5000\n\n')
+            self.assertEqual(await anext(events), self.counts_event())
+            self.assertIn(self.user.pk, broker.connected_users())
+
+            # A publish without a change sends nothing new, just the next keepalive
+            broker.publish(self.user.pk)
+            self.assertEqual(await anext(events), ': keepalive\n\n')
+
+            self.counts['unread_notifications'] = 2
+            broker.publish(self.user.pk)
+            self.assertEqual(await asyncio.wait_for(anext(events), 0.04), self.counts_event())
+        finally:
+            await events.aclose()
+            broker._poller.cancel()
+        self.assertNotIn(self.user.pk, broker.connected_users())
+
+    @override_settings(INBOX_STREAM_MAX_AGE=0.1)
+    async def test_stream_ends_after_max_age(self):
+        chunks = [chunk async for chunk in inbox_events(self.user)]
+        broker._poller.cancel()
+        self.assertEqual(chunks[:2], ['retry: 5000\n\n', self.counts_event()])
+        self.assertEqual(set(chunks[2:]), {': keepalive\n\n'})
+
+
+class InboxStreamViewTests(TestCase):
+
+    def test_wsgi_gets_no_content(self):
+        # Django's WSGI handler would drain the endless stream before sending it
+        self.client.force_login(User.objects.create_user(username='streamer', password='not-used'))
+        response = self.client.get(reverse('inbox_stream'))
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(LANGUAGES=[('en', 'English'), ('es', 'Spanish')])
+class InboxStreamRoutingTests(SimpleTestCase):
+    """Under ASGI the stream skips Django's handler at every language's URL"""
+
+    async def request(self, path):
+        django_application = mock.AsyncMock()
+        with mock.patch('memorials.live.serve_inbox_stream', new_callable=mock.AsyncMock) as serve:
+            await with_inbox_stream(django_application)({'type': 'http', 'path': path}, None, None)
+        return serve.called, django_application.called
+
+    async def test_prefixed_paths_are_served_by_the_stream(self):
+        for path in ('/notifications/stream/', '/es/notifications/stream/'):
+            with self.subTest(path=path):
+                self.assertEqual(await self.request(path), (True, False))
+
+    async def test_other_paths_go_to_django(self):
+        for path in ('/es/notifications/', '/fr/notifications/stream/'):
+            with self.subTest(path=path):
+                self.assertEqual(await self.request(path), (False, True))
+
+
+class WriteBehindTests(TestCase):
+    """enqueue_notifications buffers rows after commit; the buffer writes them in one go"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buffered', password='not-used')
+
+    def setUp(self):
+        self.buffer = NotificationBuffer()
+        patcher = mock.patch('memorials.notifications.buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notifications(self, count):
+        return [
+            Notification(user=self.user, notification_type='relationship_suggested', title=f'Note {i}', message='Hi.')
+            for i in range(count)
+        ]
+
+    @override_settings(NOTIFICATION_FLUSH_INTERVAL=60)
+    def test_buffered_on_commit_and_flushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_notifications(self.notifications(3))
+        self.assertEqual(Notification.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_rolled_back_request_buffers_nothing(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            with transaction.atomic():
+                enqueue_notifications(self.notifications(2))
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(NOTIFICATION_WRITE_BEHIND=False)
+    def test_write_behind_off_inserts_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_notifications(self.notifications(2))
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_database_error_keeps_rows_buffered(self):
+        self.buffer.add(self.notifications(3))
+        with mock.patch('memorials.notifications.create_notifications', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('memorials.notifications', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(Notification.objects.count(), 3)
+
+
+@override_settings(NOTIFICATION_FLUSH_INTERVAL=60, NOTIFICATION_FLUSH_BATCH_SIZE=4)
+class WriteBehindFlusherTests(TransactionTestCase):
+    """The flusher writes a full batch without waiting for the interval, and drops only rows the database rejects"""
+
+    def test_full_batch_flushes_early(self):
+        user = User.objects.create_user(username='flushed', password='not-used')
+        buffer = NotificationBuffer()
+        buffer.add([
+            Notification(user=user, notification_type='relationship_suggested', title=f'Note {i}', message='Hi.')
+            for i in range(4)
+        ])
+
+        deadline = time.monotonic() + 5
+        while Notification.objects.count() < 4 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_bad_row_is_dropped_alone(self):
+        # Outside a transaction, like the flusher thread, so the failed INSERT doesn't poison the rest
+        user = User.objects.create_user(username='partly', password='not-used')
+        notifications = [
+            Notification(user=user, notification_type='relationship_suggested', title=f'Note {i}', message='Hi.')
+            for i in range(3)
+        ]
+        notifications[1].user_id = user.pk + 1  # e.g. a user deleted since the row was buffered
+        buffer = NotificationBuffer()
+        buffer._pending = notifications
+
+        with self.assertLogs('memorials.notifications', 'ERROR') as logs:
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(sorted(Notification.objects.values_list('title', flat=True)), ['Note 0', 'Note 2'])
+        self.assertEqual(buffer.flush(), 0)
+
+
+@override_settings(JOB_RETRY_BACKOFF=30, JOB_LOCK_TIMEOUT=600)
+class JobQueueTests(TestCase):
+    """Claiming, retrying and recovering jobs"""
+
+    def setUp(self):
+        Job.objects.all().delete()  # rebuild jobs queued by other fixtures
+        task_calls.clear()
+
+    def test_claim_takes_due_jobs_once(self):
+        due = record.delay('now')
+        record.apply_async(['later'], countdown=60)
+
+        claimed = claim_jobs('worker-a', limit=5)
+        self.assertEqual([job.pk for job in claimed], [due.pk])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), ('running', 1))
+        self.assertTrue(claimed[0].locked_by.startswith('worker-a:'))
+        self.assertEqual(claim_jobs('worker-b', limit=5), [])
+
+    def test_long_worker_id_fits_the_lock(self):
+        job = record.delay('long')
+        worker_id = f"{'node' * 60}.internal:12345:ThreadPoolExecutor-0_0"
+
+        claimed = claim_jobs(worker_id)
+        self.assertEqual([claimed_job.pk for claimed_job in claimed], [job.pk])
+        self.assertLessEqual(len(claimed[0].locked_by), Job._meta.get_field('locked_by').max_length)
+        self.assertTrue(claimed[0].locked_by.startswith('nodenode'))
+
+    def test_success_deletes_the_job(self):
+        record.delay('done')
+        self.assertTrue(run_job(claim_jobs('worker')[0]))
+        self.assertEqual(task_calls, ['done'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        job = explode.delay()
+
+        self.assertFalse(run_job(claim_jobs('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 1, ''))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=25))
+        self.assertIn('RuntimeError: boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertFalse(run_job(claim_jobs('worker')[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(claim_jobs('worker'), [])
+
+    def test_unknown_task_fails(self):
+        Job.objects.create(task='memorials.tests.missing', max_retries=0)
+        self.assertFalse(run_job(claim_jobs('worker')[0]))
+        self.assertIn('No task registered', Job.objects.get().last_error)
+
+    def test_stale_jobs_requeued_until_attempts_run_out(self):
+        long_ago = timezone.now() - timedelta(seconds=601)
+        retry = Job.objects.create(task='memorials.tests.record', status='running', attempts=1, max_retries=3, locked_by='x', locked_at=long_ago)
+        spent = Job.objects.create(task='memorials.tests.record', status='running', attempts=4, max_retries=3, locked_by='x', locked_at=long_ago)
+        fresh = Job.objects.create(task='memorials.tests.record', status='running', attempts=1, locked_by='y', locked_at=timezone.now())
+
+        self.assertEqual(requeue_stale_jobs(), 2)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {retry.pk: 'queued', spent.pk: 'failed', fresh.pk: 'running'})
+        self.assertIn('died', Job.objects.get(pk=spent.pk).last_error)
+
+
+class JobWorkerTests(TransactionTestCase):
+    """Worker threads against a real (committed) queue"""
+
+    def setUp(self):
+        task_calls.clear()
+
+    def test_burst_runs_every_job_once(self):
+        for value in range(20):
+            record.delay(value)
+        # The in-memory SQLite test database fails concurrent writers with
+        # 'table is locked' instead of waiting, so it gets a single thread
+        concurrency = 1 if connection.vendor == 'sqlite' and connection.is_in_memory_db() else 3
+        worker = Worker(concurrency=concurrency, poll_interval=0.01, burst=True)
+        worker.run()
+
+        self.assertEqual(sorted(task_calls), list(range(20)))
+        self.assertEqual((worker.succeeded, worker.failed), (20, 0))
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_LOCK_TIMEOUT=0.2)
+    def test_heartbeat_keeps_long_jobs_locked(self):
+        outlive_lock.delay()
+        Worker(concurrency=1, poll_interval=0.01, burst=True).run()
+        # requeue_stale_jobs(), run from inside the job after the timeout, found nothing stale
+        self.assertEqual(task_calls, [0])
+        self.assertFalse(Job.objects.exists())
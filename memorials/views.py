@@ -9,13 +9,15 @@ from django.urls import reverse
 from .forms import UserNotificationSettingsForm, MultipleMemorialPhotosForm, MemorialPhotoUpdateForm
 from .forms import MemorialForm, SuggestRelationshipForm,MemorialReminderSettingsForm,MemorialPhotoForm
 from django.db.models import Q
-from django.core.paginator import Paginator
-from django_countries import countries
 from django.utils.translation import gettext as _
 from django.contrib.auth import logout
 from django.shortcuts import redirect
 import uuid
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.utils.translation import get_language
 from django.utils import timezone
 from datetime import timedelta
 from django.core.mail import send_mail
@@ -24,13 +26,32 @@ from django.contrib.auth import update_session_auth_hash
 from django.shortcuts import get_object_or_404
 from .models import Memorial, FamilyRelationship, Notification, SmartMatchSuggestion
 from memorials.matching_algorithm import find_potential_matches
+from memorials.browse import (
+    API_EXPORT_CHUNK_SIZE, BROWSE_PAGE_SIZE, SORT_MODES, available_sort_modes, filter_memorials,
+    get_facets, get_result_count, parse_api_fields, parse_browse_filters, parse_page_size, resolve_sort,
+    results_cache_key,
+)
+from memorials.caching import cache_aside
+from memorials.catalog import bump_catalog_version
+from memorials.conditional import (
+    family_tree_etag, memorial_json_etag, memorial_json_last_modified, memorial_page_etag,
+)
+from memorials.inbox import invalidate_inbox
+from memorials.live import inbox_events
+from memorials.notifications import (
+    NOTIFICATION_ORDERING, NOTIFICATION_PAGE_SIZE, dedupe_key, enqueue_notifications,
+)
+from memorials.pagination import KeysetPage, KeysetPaginator
+from memorials.search import autocomplete_memorials
 from .models import UserProfile, MemorialReminderSettings,Memorial, MemorialPhoto, UserSubscription
 from difflib import SequenceMatcher
-from django.db import models
-from django.views.decorators.http import require_http_methods
+from django.db import models, transaction
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 import stripe
 import json
+import logging
 import os
 from memorials.models import (
     Memorial, 
@@ -45,8 +66,9 @@ from memorials.models import (
 
 
 
-
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=memorial_page_etag)
 def memorial_photo_gallery(request, memorial_id):
     """
     Display photo gallery for a memorial
@@ -69,7 +91,7 @@ def memorial_photo_gallery(request, memorial_id):
         'photos': photos,
         'can_edit': can_edit,
         'is_premium': is_premium,
-        'photo_count': photos.count(),
+        'photo_count': memorial.photo_count,
         'max_photos': memorial.get_max_photos(),
     }
     
@@ -264,29 +286,42 @@ def reorder_memorial_photos(request, memorial_id):
     try:
         order_data = request.POST.getlist('photo_ids[]')
         
-        for idx, photo_id in enumerate(order_data):
-            photo = MemorialPhoto.objects.get(id=photo_id, memorial=memorial)
-            photo.order = idx
-            photo.save()
+        with transaction.atomic():
+            photos = memorial.photos.in_bulk(order_data)
+            if len(photos) != len(set(order_data)):
+                raise MemorialPhoto.DoesNotExist('MemorialPhoto matching query does not exist.')
+            
+            for idx, photo_id in enumerate(order_data):
+                photos[int(photo_id)].order = idx
+            MemorialPhoto.objects.bulk_update(photos.values(), ['order'])
+            
+            # The first photo in gallery order may now be the memorial's primary photo
+            memorial.refresh_photo_summary()
+            bump_catalog_version()  # bulk_update() skips the catalog receivers
         
         return JsonResponse({'success': True, 'message': 'Photos reordered successfully'})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=memorial_json_etag, last_modified_func=memorial_json_last_modified)
 def get_memorial_photos_json(request, memorial_id):
     """
     Get all photos for a memorial as JSON
     Useful for lightbox/carousel JavaScript libraries
     """
     memorial = get_object_or_404(Memorial, id=memorial_id, approved=True)
-    photos = memorial.photos.all().values('id', 'photo', 'caption', 'alt_text')
+    photos = memorial.photos.all().only('id', 'photo', 'caption', 'alt_text')
     
     return JsonResponse({
         'memorial_id': memorial_id,
         'memorial_name': memorial.full_name,
-        'photos': list(photos),
-        'count': photos.count(),
+        'photos': [
+            {'id': photo.id, 'photo': photo.photo.url, 'caption': photo.caption, 'alt_text': photo.alt_text}
+            for photo in photos
+        ],
+        'count': memorial.photo_count,
     })
 
 
@@ -465,6 +500,7 @@ def accept_smart_match(request, my_memorial_id, suggested_memorial_id):
         my_memorial=my_memorial,
         suggested_memorial=suggested_memorial
     ).update(status='accepted')
+    invalidate_inbox(request.user.id)  # update() skips the inbox receivers
     
     # Redirect to suggest relationship page with pre-filled data
     return redirect(
@@ -487,6 +523,7 @@ def dismiss_smart_match(request, my_memorial_id, suggested_memorial_id):
         my_memorial=my_memorial,
         suggested_memorial=suggested_memorial
     ).update(status='dismissed')
+    invalidate_inbox(request.user.id)  # update() skips the inbox receivers
     
     messages.success(request, "Suggestion dismissed.")
     return redirect('smart_match_suggestions')
@@ -502,10 +539,11 @@ def archive_all_smart_matches(request):
             created_by=request.user
         )
         
-        count, _ = SmartMatchSuggestion.objects.filter(
+        count = SmartMatchSuggestion.objects.filter(
             my_memorial=memorial,
             status='pending'
         ).update(status='archived')
+        invalidate_inbox(request.user.id)
         
         messages.success(request, f"Archived {count} suggestions.")
         return redirect('smart_match_suggestions')
@@ -644,14 +682,16 @@ def notification_settings(request):
     # Get or create user profile
     profile, created = UserProfile.objects.get_or_create(user=request.user)
     
+    # Free users can only change the digest; the anniversary fields are locked
+    premium = profile.is_premium_active
     if request.method == 'POST':
-        form = UserNotificationSettingsForm(request.POST, instance=profile)
+        form = UserNotificationSettingsForm(request.POST, instance=profile, premium=premium)
         if form.is_valid():
             form.save()
             messages.success(request, 'Notification settings updated successfully!')
             return redirect('notification_settings')
     else:
-        form = UserNotificationSettingsForm(instance=profile)
+        form = UserNotificationSettingsForm(instance=profile, premium=premium)
     
     # Get user's memorials for per-memorial settings
     user_memorials = Memorial.objects.filter(created_by=request.user, approved=True).order_by('full_name')
@@ -696,17 +736,19 @@ def memorial_reminder_settings(request, memorial_id):
 
 
 def create_notification(user, notification_type, title, message, action_url='', **kwargs):
-    """Helper function to create notifications"""
-    Notification.objects.create(
+    """Helper function to queue notifications (at most one per user, type and related relationship), written after the response"""
+    related_relationship = kwargs.get('related_relationship')
+    enqueue_notifications([Notification(
         user=user,
         notification_type=notification_type,
         title=title,
         message=message,
         action_url=action_url,
         related_memorial=kwargs.get('related_memorial'),
-        related_relationship=kwargs.get('related_relationship'),
+        related_relationship=related_relationship,
         related_user=kwargs.get('related_user'),
-    )
+        dedupe_key=dedupe_key(notification_type, related_relationship.pk) if related_relationship else None,
+    )])
 
 def notify_relationship_suggested(relationship):
     """Notify memorial owners when a relationship is suggested"""
@@ -771,6 +813,8 @@ def notify_relationship_rejected(relationship, rejected_by):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=family_tree_etag)
 def family_tree_view(request, memorial_id):
     """Display interactive family tree for a memorial"""
     memorial = get_object_or_404(Memorial, id=memorial_id, approved=True)
@@ -1022,63 +1066,143 @@ def browse_memorials(request):
     birth_year = request.GET.get('birth_year', '')
     death_year = request.GET.get('death_year', '')
     
-    # Start with approved memorials
-    memorials = Memorial.objects.filter(approved=True)
+    # Approved memorials matching the normalized filters (search annotates search_rank)
+    filters = parse_browse_filters(request.GET)
+    memorials = filter_memorials(Memorial.objects.filter(approved=True), filters)
     
-    # Apply search filters
-    if query:
-        memorials = memorials.filter(
-            Q(full_name__icontains=query) |
-            Q(story__icontains=query) |
-            Q(country__icontains=query)
-        )
+    # Order memorials - only whitelisted sorts, searches default to most relevant first
+    sort_by = resolve_sort(request.GET.get('sort', ''), filters['q'])
     
-    if country:
-        memorials = memorials.filter(country=country)
+    # Keyset pagination - 20 per page, continued from an opaque cursor
+    # (with_photo_summary joins each card's thumbnail; photo_count is a column)
+    paginator = KeysetPaginator(memorials.with_photo_summary(), SORT_MODES[sort_by]['ordering'], BROWSE_PAGE_SIZE)
     
-    # Fix birth year filter
-    if birth_year:
-        try:
-            birth_year_int = int(birth_year)
-            memorials = memorials.filter(dob__year=birth_year_int)
-        except (ValueError, TypeError):
-            pass  # Ignore invalid birth year input
+    # The rendered result cards (and the page's cursors) are cached per filter, sort, page
+    # and language; the key carries the catalog version, so any memorial change invalidates them.
+    # Unsigned cursors show the first page anyway, so they share its key instead of adding entries
+    cursor = request.GET.get('cursor', '')
+    if not paginator.is_valid_cursor(cursor):
+        cursor = ''
+    results_key = results_cache_key(filters, sort_by, cursor, get_language())
     
-    # Fix death year filter  
-    if death_year:
-        try:
-            death_year_int = int(death_year)
-            memorials = memorials.filter(dod__year=death_year_int)
-        except (ValueError, TypeError):
-            pass  # Ignore invalid death year input
+    def render_results():
+        page = paginator.get_page(cursor)
+        
+        # Only process relationships for the current page
+        if getattr(settings, 'ENABLE_FAMILY_RELATIONSHIPS', False):
+            for memorial in page:
+                memorial.relationships = get_memorial_relationships(memorial)
+        
+        return {
+            'html': render_to_string('memorials/browse_results.html', {
+                'memorials': page,
+                'query': filters['q'],
+                'ENABLE_FAMILY_RELATIONSHIPS': getattr(settings, 'ENABLE_FAMILY_RELATIONSHIPS', False),
+            }),
+            'has_results': bool(page),
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        }
     
-    # Order memorials
-    sort_by = request.GET.get('sort', '-created_at')
-    memorials = memorials.order_by(sort_by)
+    results = cache_aside(
+        results_key, render_results, alias='fragments',
+        timeout=getattr(settings, 'BROWSE_RESULTS_CACHE_TIMEOUT', 300), log_level=logging.INFO,
+    )
+    page_obj = KeysetPage([], results['next_cursor'], results['previous_cursor'])
     
-    # Add pagination - show 20 per page
-    paginator = Paginator(memorials, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Cached (and on PostgreSQL, for big results, estimated) total
+    total_count, count_is_approximate = get_result_count(memorials, filters)
     
-    # Only process relationships for the current page
-    if getattr(settings, 'ENABLE_FAMILY_RELATIONSHIPS', False):
-        for memorial in page_obj:
-            memorial.relationships = get_memorial_relationships(memorial)
+    # Country / decade counts for the sidebar, each counted without its own filter (cached)
+    facets = get_facets(Memorial.objects.filter(approved=True), filters)
     
     context = {
-        'memorials': page_obj,
+        'results_html': results['html'],
         'page_obj': page_obj,
+        'has_results': results.get('has_results', False),
+        'total_count': total_count,
+        'count_is_approximate': count_is_approximate,
         'query': query,
         'country': country,
         'birth_year': birth_year,
         'death_year': death_year,
+        'sort': sort_by,
+        'sort_modes': available_sort_modes(filters['q']),
         'current_view': request.GET.get('view', 'list'),
-        'countries': countries,  # Add this
+        'facets': facets,
         'ENABLE_FAMILY_RELATIONSHIPS': getattr(settings, 'ENABLE_FAMILY_RELATIONSHIPS', False),
     }
     return render(request, 'memorials/browse.html', context)
 
+
+@require_http_methods(["GET"])
+def memorial_search_api(request):
+    """
+    Read-only JSON search over approved memorials, with the same filters and sorts as browse.
+    ?fields=id,full_name,... picks the columns (see browse.API_FIELDS), ?limit= the page size
+    and ?cursor= continues from next_cursor/previous_cursor.
+    ?format=ndjson streams every match as one JSON object per line instead of paging.
+    """
+    try:
+        fields = parse_api_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filters = parse_browse_filters(request.GET)
+    memorials = filter_memorials(Memorial.objects.filter(approved=True), filters)
+    ordering = SORT_MODES[resolve_sort(request.GET.get('sort', ''), filters['q'])]['ordering']
+
+    if request.GET.get('format') == 'ndjson':
+        # Rows are fetched in chunks (a server-side cursor on PostgreSQL) and written as they
+        # arrive, so an export of the whole catalog never sits in memory
+        rows = memorials.order_by(*ordering).values(*fields).iterator(chunk_size=API_EXPORT_CHUNK_SIZE)
+        lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+    # The cursor is built from the ordering columns, so select them even if not requested
+    keys = [field.lstrip('-') for field in ordering]
+    columns = list(fields) + [key for key in keys if key not in fields]
+    paginator = KeysetPaginator(memorials.values(*columns), ordering, parse_page_size(request.GET.get('limit')))
+    page = paginator.get_page(request.GET.get('cursor'))
+
+    return JsonResponse({
+        'results': [{field: row[field] for field in fields} for row in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@require_http_methods(["GET"])
+def memorial_autocomplete(request):
+    """
+    AJAX endpoint for name typeahead: approved memorials whose name starts with ?q=
+    ?scope=mine limits results to the user's own memorials (for the relationship pickers),
+    ?exclude=<id> drops one memorial (e.g. the one being linked to)
+    """
+    memorials = Memorial.objects.filter(approved=True)
+    if request.GET.get('scope') == 'mine':
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=403)
+        memorials = memorials.filter(created_by=request.user)
+
+    exclude = request.GET.get('exclude', '')
+    if exclude.isdigit():
+        memorials = memorials.exclude(id=exclude)
+
+    # Labels match Memorial.__str__, which the relationship <select>s render
+    rows = autocomplete_memorials(memorials, request.GET.get('q', '')).values('id', 'full_name', 'dob', 'dod')
+    results = []
+    for row in rows:
+        dob_str = row['dob'].strftime('%b %d, %Y') if row['dob'] else '?'
+        dod_str = row['dod'].strftime('%b %d, %Y') if row['dod'] else '?'
+        results.append({
+            'id': row['id'],
+            'name': row['full_name'],
+            'text': f"{row['full_name']} ({dob_str} – {dod_str})",
+        })
+    return JsonResponse({'results': results})
+
+
 def home(request):
     if request.user.is_authenticated:
         return redirect('create_memorial')
@@ -1106,7 +1230,7 @@ def logout_view(request):
 def my_memorials(request):
     """Display all memorials submitted by the current user"""
     # Get memorials created by the current user (both approved and pending)
-    memorials = Memorial.objects.filter(created_by=request.user).order_by('-created_at')
+    memorials = Memorial.objects.filter(created_by=request.user).with_photo_summary().order_by('-created_at')
     
     # Add relationship data for each memorial (if feature is enabled)
     if getattr(settings, 'ENABLE_FAMILY_RELATIONSHIPS', False):
@@ -1487,12 +1611,16 @@ def reject_relationship_suggestion(request, relationship_id):
 
 @login_required
 def notifications_list(request):
-    """Display all notifications for the user"""
-    notifications = Notification.objects.filter(user=request.user)
+    """Display the user's notifications, unread and read paged separately by cursor"""
+    notifications = Notification.objects.filter(user=request.user).select_related('related_user')
     
-    # Separate unread and read
-    unread_notifications = notifications.filter(is_read=False)
-    read_notifications = notifications.filter(is_read=True)[:20]  # Last 20 read
+    # Separate unread and read - each list continues from its own opaque cursor
+    unread_notifications = KeysetPaginator(
+        notifications.filter(is_read=False), NOTIFICATION_ORDERING, NOTIFICATION_PAGE_SIZE
+    ).get_page(request.GET.get('unread_cursor'))
+    read_notifications = KeysetPaginator(
+        notifications.filter(is_read=True), NOTIFICATION_ORDERING, NOTIFICATION_PAGE_SIZE
+    ).get_page(request.GET.get('read_cursor'))
     
     context = {
         'unread_notifications': unread_notifications,
@@ -1522,5 +1650,24 @@ def mark_all_notifications_read(request):
         is_read=True,
         read_at=timezone.now()
     )
+    invalidate_inbox(request.user.id)
     messages.success(request, 'All notifications marked as read.')
-    return redirect('notifications_list')
\ No newline at end of file
+    return redirect('notifications_list')
+
+
+async def inbox_stream(request):
+    """Server-Sent Events: the navbar badge counts, pushed as they change (see memorials.live)"""
+    # Under WSGI (runserver, wsgi.py) Django reads an async iterator to the end
+    # before sending any of it, so the stream would hold a thread for
+    # INBOX_STREAM_MAX_AGE and deliver nothing; the badges just stay static
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)  # 204 tells EventSource to stop reconnecting
+    
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(inbox_events(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
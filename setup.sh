@@ -3,6 +3,9 @@
 echo "Applying migrations..."
 python manage.py migrate --noinput
 
+echo "Creating cache table..."
+python manage.py createcachetable
+
 echo "Creating superuser (if not exists)..."
 python manage.py shell << END
 from django.contrib.auth import get_user_model
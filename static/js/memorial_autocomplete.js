@@ -0,0 +1,98 @@
+// Name typeahead backed by the memorial_autocomplete endpoint.
+//
+// <select data-autocomplete-url>: the server renders only the current choice;
+// a search box is added above it and matching memorials are loaded as options.
+// <input data-autocomplete-url list="..">: suggestions fill the linked <datalist>.
+(function () {
+    'use strict';
+
+    const MIN_CHARS = 2;
+    const DELAY_MS = 200;
+
+    function fetchMatches(element, term, callback) {
+        if (element._autocompleteRequest) {
+            element._autocompleteRequest.abort();
+        }
+        const controller = new AbortController();
+        element._autocompleteRequest = controller;
+
+        const params = new URLSearchParams({ q: term });
+        if (element.dataset.autocompleteScope) {
+            params.set('scope', element.dataset.autocompleteScope);
+        }
+        if (element.dataset.autocompleteExclude) {
+            params.set('exclude', element.dataset.autocompleteExclude);
+        }
+
+        fetch(element.dataset.autocompleteUrl + '?' + params.toString(), {
+            credentials: 'same-origin',
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            signal: controller.signal,
+        })
+            .then(response => response.ok ? response.json() : { results: [] })
+            .then(data => callback(data.results || []))
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Autocomplete failed:', error);
+                }
+            });
+    }
+
+    function onTyping(input, handler) {
+        let timer = null;
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            const term = input.value.trim();
+            if (term.length < MIN_CHARS) {
+                return;
+            }
+            timer = setTimeout(() => handler(term), DELAY_MS);
+        });
+    }
+
+    function setupSelect(select) {
+        const search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control mb-2';
+        search.placeholder = select.dataset.autocompletePlaceholder || 'Type a name to search...';
+        search.autocomplete = 'off';
+        select.parentNode.insertBefore(search, select);
+
+        onTyping(search, term => fetchMatches(select, term, results => {
+            // Keep the empty choice and the current selection, replace the rest
+            Array.from(select.options).forEach(option => {
+                if (option.value && !option.selected) {
+                    option.remove();
+                }
+            });
+            results.forEach(result => {
+                if (select.querySelector('option[value="' + result.id + '"]')) {
+                    return;
+                }
+                select.add(new Option(result.text, result.id));
+            });
+            if (results.length && !select.value) {
+                select.size = Math.min(results.length + 1, 8);
+            }
+        }));
+
+        select.addEventListener('change', () => {
+            select.size = 0;
+        });
+    }
+
+    function setupInput(input) {
+        const datalist = document.getElementById(input.getAttribute('list'));
+        if (!datalist) {
+            return;
+        }
+        onTyping(input, term => fetchMatches(input, term, results => {
+            datalist.replaceChildren(...results.map(result => new Option(result.name)));
+        }));
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(setupSelect);
+        document.querySelectorAll('input[data-autocomplete-url]').forEach(setupInput);
+    });
+})();